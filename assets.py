@@ -0,0 +1,60 @@
+import base64
+import json
+import mmap
+import threading
+
+# Built by generador.py: an index of name -> (offset, length) into a blob of base64 strings
+ASSETS_INDEX_PATH = 'recursos.json'
+ASSETS_BLOB_PATH = 'recursos.bin'
+
+# Asset name -> (source image, box it is displayed in, encoding). Images are shrunk to fit the
+# box keeping their aspect ratio; a None source is a black frame of exactly that size.
+ASSET_SPECS = {
+    "user_logo": ("imagenes/user.png", (100, 100), ".png"),
+    "home_image": ("imagenes/contenedores.jpg", (420, 420), ".jpg"),
+    "black_frame": (None, (420, 420), ".jpg"),
+}
+
+_index = None
+_blob = None
+_cache = {}
+_lock = threading.Lock()
+
+def _open_bundle():
+    global _index, _blob
+    if _index is not None:
+        return
+    try:
+        with open(ASSETS_INDEX_PATH, 'r', encoding="utf-8") as file:
+            index = json.load(file)
+        with open(ASSETS_BLOB_PATH, 'rb') as file:
+            _blob = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        _index = index["assets"]
+    except (OSError, ValueError, KeyError):
+        print("Asset bundle not found, run generador.py to build it")
+        _index = {}
+
+def _encode_from_source(name):
+    """Fallback when the bundle is missing: encode the asset at runtime."""
+    source, (width, height), ext = ASSET_SPECS[name]
+    if source is not None:
+        with open(source, 'rb') as file:
+            return base64.b64encode(file.read()).decode()
+    import cv2
+    import numpy as np
+    _, buffer = cv2.imencode(ext, np.zeros((height, width, 3), np.uint8))
+    return base64.b64encode(buffer).decode()
+
+def get_asset(name):
+    """Return the base64 string for an asset, reading it from the bundle on first use."""
+    with _lock:
+        if name in _cache:
+            return _cache[name]
+        _open_bundle()
+        entry = _index.get(name)
+        if entry is not None:
+            value = _blob[entry["offset"]:entry["offset"] + entry["length"]].decode('ascii')
+        else:
+            value = _encode_from_source(name)
+        _cache[name] = value
+        return value
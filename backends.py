@@ -0,0 +1,56 @@
+import os
+
+# Inference backends for the YOLO model. Every backend is loaded through
+# ultralytics.YOLO, so they all return the same Results/boxes structure the
+# detection loop consumes; only the runtime behind model(frame) changes.
+SOURCE_WEIGHTS = 'besto.pt'
+
+BACKENDS = {
+    "pytorch": {"weights": "besto.pt"},
+    "onnx": {"weights": "besto.onnx", "export": {"format": "onnx", "dynamic": True, "simplify": True}},
+    "onnx-int8": {"weights": "besto.int8.onnx", "base": "onnx"},
+    "openvino": {"weights": "besto_openvino_model", "export": {"format": "openvino", "dynamic": True}},
+    # INT8 calibration exports a fixed input shape, so this backend always runs at static_imgsz
+    "openvino-int8": {"weights": "besto_int8_openvino_model", "export": {"format": "openvino", "int8": True, "imgsz": 640},
+                      "static_imgsz": 640},
+}
+
+# Selected with the ECOALDASO_BACKEND environment variable, e.g. ECOALDASO_BACKEND=onnx
+DEFAULT_BACKEND = os.environ.get("ECOALDASO_BACKEND", "pytorch")
+
+def static_input_size(name=None):
+    """Input size a backend only accepts, or None if it takes any size."""
+    return BACKENDS.get(name or DEFAULT_BACKEND, {}).get("static_imgsz")
+
+def export_backend(name, source=SOURCE_WEIGHTS):
+    """Export the source weights for a backend and return the exported path."""
+    spec = BACKENDS[name]
+    if "base" in spec:
+        # ONNX Runtime INT8: dynamic quantization of the exported FP32 graph
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        base_path = get_backend_weights(spec["base"], source)
+        quantize_dynamic(base_path, spec["weights"], weight_type=QuantType.QUInt8)
+        return spec["weights"]
+    if "export" not in spec:
+        return spec["weights"]
+
+    from ultralytics import YOLO
+    exported = YOLO(source).export(**spec["export"])
+    if os.path.normpath(exported) != os.path.normpath(spec["weights"]):
+        os.replace(exported, spec["weights"])
+    return spec["weights"]
+
+def get_backend_weights(name, source=SOURCE_WEIGHTS):
+    """Return the weights path for a backend, exporting it on first use."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
+    path = BACKENDS[name]["weights"]
+    if not os.path.exists(path):
+        print(f"Exporting {source} for the {name} backend...")
+        path = export_backend(name, source)
+    return path
+
+def load_backend(name=None, source=SOURCE_WEIGHTS):
+    """Load the model for an inference backend (DEFAULT_BACKEND if not given)."""
+    from ultralytics import YOLO
+    return YOLO(get_backend_weights(name or DEFAULT_BACKEND, source), task='detect')
@@ -0,0 +1,287 @@
+import argparse
+import base64
+import gc
+import glob
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import cv2
+from backends import BACKENDS, load_backend, static_input_size
+from presenter import letterbox
+from tracking import box_iou
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def load_images(directory, width=420, height=420):
+    """Load every image in a directory, letterboxed the way the detection loop fits frames."""
+    paths = sorted(path for path in glob.glob(os.path.join(directory, '*')) if path.lower().endswith(IMAGE_EXTENSIONS))
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is not None:
+            images.append((os.path.basename(path), letterbox(image, width, height)[0]))
+    return images
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def latency_summary(latencies):
+    """p50/p95/p99 in milliseconds and throughput for a list of latencies in seconds."""
+    total = sum(latencies)
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "fps": len(latencies) / total if total else 0.0,
+    }
+
+def extract_detections(model, results):
+    """Turn YOLO results into (class name, confidence, [x1, y1, x2, y2]) tuples."""
+    detections = []
+    for result in results:
+        for box in result.boxes:
+            detections.append((model.names[int(box.cls)], float(box.conf), box.xyxy[0].tolist()))
+    return detections
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    """Count candidate boxes matching a reference box of the same class (greedy, by IoU)."""
+    unmatched = list(reference)
+    matched = 0
+    for label, _, box in sorted(candidate, key=lambda d: -d[1]):
+        best, best_iou = None, iou_threshold
+        for ref in unmatched:
+            if ref[0] == label:
+                iou = box_iou(box, ref[2])
+                if iou >= best_iou:
+                    best, best_iou = ref, iou
+        if best is not None:
+            unmatched.remove(best)
+            matched += 1
+    return matched
+
+def run_backend(name, images, repeats=1):
+    model = load_backend(name)
+    model(images[0][1], verbose=False)  # Warm-up
+    latencies = []
+    detections = {}
+    for _ in range(repeats):
+        for image_name, image in images:
+            start = time.perf_counter()
+            results = model(image, verbose=False)
+            latencies.append(time.perf_counter() - start)
+            detections[image_name] = extract_detections(model, results)
+    return latencies, detections
+
+def compare_backends(images, names, repeats=1, reference="pytorch"):
+    """Benchmark backends on the same images; accuracy is measured against `reference`."""
+    names = [reference] + [name for name in names if name != reference]
+    runs = {name: run_backend(name, images, repeats) for name in names}
+    reference_detections = runs[reference][1]
+    reference_total = sum(len(d) for d in reference_detections.values())
+
+    report = {}
+    for name, (latencies, detections) in runs.items():
+        matched = sum(match_detections(reference_detections[image], detections[image]) for image in detections)
+        found = sum(len(d) for d in detections.values())
+        report[name] = latency_summary(latencies)
+        report[name]["recall"] = matched / reference_total if reference_total else 1.0
+        report[name]["precision"] = matched / found if found else 1.0
+    return report
+
+class ReplayCapture:
+    """Stand-in for cv2.VideoCapture that replays a video file or an image directory.
+
+    Lets the detection hot path run on a machine without a camera.
+    """
+
+    def __init__(self, source, loop=False):
+        self.loop = loop
+        self._video = None
+        self._images = []
+        self._position = 0
+        if os.path.isdir(source):
+            self._images = [image for _, image in load_images(source, *self._native_size(source))]
+        else:
+            self._video = cv2.VideoCapture(source)
+
+    @staticmethod
+    def _native_size(directory):
+        # Keep the recorded resolution so the resize stage is measured like on the kiosk
+        for path in sorted(glob.glob(os.path.join(directory, '*'))):
+            image = cv2.imread(path) if path.lower().endswith(IMAGE_EXTENSIONS) else None
+            if image is not None:
+                return image.shape[1], image.shape[0]
+        return 640, 480
+
+    def isOpened(self):
+        return bool(self._images) or (self._video is not None and self._video.isOpened())
+
+    def read(self):
+        if self._video is not None:
+            ret, frame = self._video.read()
+            if not ret and self.loop:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self._video.read()
+            return ret, frame
+        if self._position >= len(self._images):
+            if not self.loop or not self._images:
+                return False, None
+            self._position = 0
+        frame = self._images[self._position].copy()
+        self._position += 1
+        return True, frame
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+def run_hot_path(source, backend, frames=200, width=420, height=420, jpeg_quality=80, imgsz=None):
+    """Replay frames through the detection hot path, timing each stage separately."""
+    from detection import annotate_results, build_record, inference_settings, prepare_frame
+    from database import RecordStore
+
+    cap = ReplayCapture(source, loop=True)
+    if not cap.isOpened():
+        raise ValueError(f"Nothing to replay in {source}")
+    model = load_backend(backend)
+    imgsz = static_input_size(backend) or imgsz or inference_settings["idle_imgsz"]
+    model(prepare_frame(cap.read()[1], width, height, imgsz)[1], imgsz=imgsz, verbose=False)  # Warm-up
+    stages = {name: [] for name in ("capture", "resize", "inference", "boxes", "encode", "persist", "total")}
+    encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = RecordStore(os.path.join(directory, 'records.jsonl'), os.path.join(directory, 'records.json'),
+                            os.path.join(directory, 'records_aggregates.json'))
+        for _ in range(frames):
+            timings = {}
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            timings["capture"] = time.perf_counter()
+            frame, model_input, transform = prepare_frame(frame, width, height, imgsz)
+            timings["resize"] = time.perf_counter()
+            results = model(model_input, imgsz=imgsz, verbose=False)
+            timings["inference"] = time.perf_counter()
+            (frame, detections), = annotate_results(model, [frame], results, [transform])
+            timings["boxes"] = time.perf_counter()
+            _, buffer = cv2.imencode('.jpg', frame, encode_params)
+            base64.b64encode(buffer).decode()
+            timings["encode"] = time.perf_counter()
+            label, confidence = detections[0][:2] if detections else ("desconocido", 0.0)
+            store.append(build_record(label, confidence))
+            timings["persist"] = time.perf_counter()
+
+            previous = start
+            for name, end in timings.items():
+                stages[name].append(end - previous)
+                previous = end
+            stages["total"].append(previous - start)
+        store.close()
+    cap.release()
+    return {name: latency_summary(latencies) for name, latencies in stages.items()}
+
+def compare_record_layouts(count=100000, seed=0):
+    """Memory and group-by time of the records as a list of dicts versus RecordColumns."""
+    from detection import container_mapping, names_esp_mapping, points_mapping
+    from record_columns import RecordColumns
+    from history import MONTH
+
+    rng = random.Random(seed)
+    start_epoch = time.mktime((2022, 1, 1, 0, 0, 0, 0, 0, -1))
+    lines = []
+    for _ in range(count):
+        name = rng.choice(list(names_esp_mapping))
+        label = names_esp_mapping[name]
+        lines.append(json.dumps({
+            "label": label, "confidence": rng.uniform(0.6, 1.0), "points": points_mapping[label],
+            "container": container_mapping[name],
+            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_epoch + rng.uniform(0, 3 * 365 * 86400))),
+            "user": f"usuario{rng.randrange(50)}", "kiosk": "kiosk1",
+        }, ensure_ascii=False))
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = [json.loads(line) for line in lines]  # As the record store loads them
+    dicts_load = time.perf_counter() - start
+    dicts_memory = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    columns = RecordColumns.from_records(records)
+    columns_load = time.perf_counter() - start + dicts_load
+    start = time.perf_counter()
+    month_points = {}
+    for record in records:
+        month = record['timestamp'][:7]
+        month_points[month] = month_points.get(month, 0) + record['points']
+    dicts_group = time.perf_counter() - start
+    del records
+    gc.collect()
+    columns_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    months, points = columns.sum_by_period(MONTH)
+    columns_group = time.perf_counter() - start
+    if dict(zip(months, points)) != month_points:
+        print("Warning: columnar month totals differ from the dict totals")
+
+    return {
+        "dicts": {"memory_mb": dicts_memory / 2 ** 20, "load_ms": dicts_load * 1000, "month_sum_ms": dicts_group * 1000},
+        "columns": {"memory_mb": columns_memory / 2 ** 20, "load_ms": columns_load * 1000, "month_sum_ms": columns_group * 1000},
+    }
+
+def print_report(report):
+    columns = list(next(iter(report.values())).keys())
+    print(f"{'':16}" + "".join(f"{column:>12}" for column in columns))
+    for name, row in report.items():
+        print(f"{name:16}" + "".join(f"{row[column]:>12.2f}" for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backends_parser = subparsers.add_parser("backends", help="Compare inference backends on a fixed image set")
+    backends_parser.add_argument("images", help="Directory of test images")
+    backends_parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    backends_parser.add_argument("--repeats", type=int, default=3)
+
+    hot_path_parser = subparsers.add_parser("hotpath", help="Time each stage of the detection loop on recorded frames")
+    hot_path_parser.add_argument("source", help="Video file or directory of images to replay instead of the camera")
+    hot_path_parser.add_argument("--backends", nargs="+", default=["pytorch"], choices=list(BACKENDS))
+    hot_path_parser.add_argument("--jpeg-quality", nargs="+", type=int, default=[80])
+    hot_path_parser.add_argument("--frames", type=int, default=200)
+    hot_path_parser.add_argument("--imgsz", nargs="+", type=int, default=[None], help="Model input sizes to compare")
+
+    records_parser = subparsers.add_parser("records", help="Compare list-of-dicts and columnar record memory")
+    records_parser.add_argument("--count", type=int, default=100000)
+
+    args = parser.parse_args()
+    if args.command == "hotpath":
+        for backend in args.backends:
+            for quality in args.jpeg_quality:
+                for imgsz in args.imgsz:
+                    print(f"\n{backend}, JPEG quality {quality}, input size {imgsz or 'idle'}")
+                    print_report(run_hot_path(args.source, backend, args.frames, jpeg_quality=quality, imgsz=imgsz))
+    elif args.command == "backends":
+        images = load_images(args.images)
+        if not images:
+            parser.error(f"No images found in {args.images}")
+        print_report(compare_backends(images, args.backends, args.repeats))
+    elif args.command == "records":
+        print(f"{args.count} records")
+        print_report(compare_record_layouts(args.count))
+
+
+if __name__ == "__main__":
+    main()
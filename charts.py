@@ -1,7 +1,12 @@
-import matplotlib.pyplot as plt
 import io
+import os
 import base64
-from collections import defaultdict
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from history import DAY, MONTH, WEEK, days_ago
 
 # CO2 savings values for different materials (in grams per 25 grams of material)
 CO2_SAVINGS = {
@@ -13,14 +18,99 @@ CO2_SAVINGS = {
     "Biodegradable": 62.5  # Assuming Biodegradable is equivalent to Organic
 }
 
-def generate_total_co2_per_material(object_records):
-    material_points = defaultdict(int)
-    
-    # Aggregate points by material
-    for record in object_records:
-        material = record['label']
-        material_points[material] += record['points']
-    
+# Ranges offered in the Historical tab: name -> (bucket granularity, days back, None for all time)
+HISTORY_RANGES = {
+    "Todo": (MONTH, None),
+    "Último año": (MONTH, 365),
+    "Últimos 3 meses": (WEEK, 91),
+    "Último mes": (DAY, 30),
+    "Última semana": (DAY, 7),
+}
+BUCKET_LABELS = {DAY: 'Día', WEEK: 'Semana', MONTH: 'Mes'}
+
+# Rendered charts are cached by the data they plot, in memory and on disk
+CHART_CACHE_DIR = 'chart_cache'
+chart_cache_size = 16  # Entries kept in memory
+chart_disk_cache_size = 64  # PNG files kept in CHART_CACHE_DIR
+CHART_CACHE_VERSION = 1  # Bump when chart styling changes to invalidate cached PNGs
+
+_chart_cache = OrderedDict()
+_chart_cache_lock = threading.Lock()
+_render_lock = threading.Lock()  # pyplot keeps global state, so renders are serialized
+_render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-render")
+
+def _chart_cache_key(kind, *series):
+    payload = json.dumps([CHART_CACHE_VERSION, kind, *series], ensure_ascii=False)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def _read_disk_cache(key):
+    path = os.path.join(CHART_CACHE_DIR, key + '.png')
+    try:
+        with open(path, 'rb') as file:
+            png = file.read()
+        os.utime(path)  # Mark as recently used for disk eviction
+        return png
+    except OSError:
+        return None
+
+def _write_disk_cache(key, png):
+    try:
+        os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+        tmp_path = os.path.join(CHART_CACHE_DIR, key + '.tmp')
+        with open(tmp_path, 'wb') as file:
+            file.write(png)
+        os.replace(tmp_path, os.path.join(CHART_CACHE_DIR, key + '.png'))
+
+        entries = [os.path.join(CHART_CACHE_DIR, name) for name in os.listdir(CHART_CACHE_DIR) if name.endswith('.png')]
+        if len(entries) > chart_disk_cache_size:
+            entries.sort(key=os.path.getmtime)
+            for path in entries[:len(entries) - chart_disk_cache_size]:
+                os.remove(path)
+    except OSError as e:
+        print(f"Error writing chart cache: {e}")
+
+def cached_chart(kind, render, *series):
+    """Return the base64 PNG for a chart, rendering it only if its data changed.
+
+    `series` is the plotted data and forms the cache key together with `kind`.
+    """
+    key = _chart_cache_key(kind, *series)
+    with _chart_cache_lock:
+        if key in _chart_cache:
+            _chart_cache.move_to_end(key)
+            return _chart_cache[key]
+
+    png = _read_disk_cache(key)
+    if png is None:
+        with _render_lock:
+            png = render(*series)
+        _write_disk_cache(key, png)
+    img_str = base64.b64encode(png).decode()
+
+    with _chart_cache_lock:
+        _chart_cache[key] = img_str
+        _chart_cache.move_to_end(key)
+        while len(_chart_cache) > chart_cache_size:
+            _chart_cache.popitem(last=False)
+    return img_str
+
+def _pyplot():
+    # matplotlib is imported on the first render, on the chart thread, so it never delays startup
+    import matplotlib.pyplot as plt
+    return plt
+
+def _figure_to_png():
+    plt = _pyplot()
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format='png')
+    plt.close()
+    return buffer.getvalue()
+
+def generate_total_co2_per_material(aggregates):
+    # Points per material are maintained incrementally by the record store
+    return co2_per_material(dict(aggregates.material_points))
+
+def co2_per_material(material_points):
     # Calculate total CO2 saved for each material
     material_co2 = {}
     for material, points in material_points.items():
@@ -34,9 +124,17 @@ def generate_total_co2_per_material(object_records):
     
     return materials, co2_values
 
-def plot_co2_by_material(object_records):
+def co2_total(material_points):
+    """Grams of CO2 saved for the given points per material."""
+    return sum(points * CO2_SAVINGS.get(material, 0) for material, points in material_points.items())
+
+def plot_co2_by_material(aggregates):
     # Generate the data
-    materials, co2_values = generate_total_co2_per_material(object_records)
+    materials, co2_values = generate_total_co2_per_material(aggregates)
+    return cached_chart('co2_by_material', _render_co2_by_material, materials, co2_values)
+
+def _render_co2_by_material(materials, co2_values):
+    plt = _pyplot()
     plt.switch_backend('Agg')  # Use non-GUI backend
     # Create the bar plot
     plt.figure(figsize=(5, 5))
@@ -47,19 +145,10 @@ def plot_co2_by_material(object_records):
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()  # Adjust layout to make room for the rotated x-axis labels
     
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    plt.close()
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.read()).decode()
-    
-    return img_str
+    return _figure_to_png()
 
-def generate_historical_data(object_records):
-    month_points = defaultdict(int)
-    for record in object_records:
-        month = record['timestamp'][:7]  # Extract the year and month (YYYY-MM)
-        month_points[month] += record['points']
+def generate_historical_data(aggregates):
+    month_points = dict(aggregates.month_points)
 
     months = sorted(month_points.keys())
     points = [month_points[month] for month in months]
@@ -67,19 +156,53 @@ def generate_historical_data(object_records):
     return months, points
 
 def create_chart(months, points):
+    return cached_chart('historical_points', _render_historical_chart, months, points)
+
+def _render_historical_chart(months, points, xlabel='Mes'):
+    plt = _pyplot()
     plt.switch_backend('Agg')  # Use non-GUI backend
     plt.figure(figsize=(5, 5))
     plt.plot(months, points, marker='o', linestyle='-', color='b')
-    plt.xlabel('Mes')
+    plt.xlabel(xlabel)
     plt.ylabel('Puntos')
     plt.title('Tus puntos acumulados')
     plt.xticks(rotation=45)
     plt.tight_layout()
     
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    plt.close()
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.read()).decode()
-    
-    return img_str
\ No newline at end of file
+    return _figure_to_png()
+
+def render_charts_async(aggregates, on_done):
+    """Render the historical and CO2 charts on the chart worker thread.
+
+    `on_done(points_chart, co2_chart)` is called with both base64 PNGs once ready.
+    """
+    def work():
+        try:
+            months, points = generate_historical_data(aggregates)
+            on_done(create_chart(months, points), plot_co2_by_material(aggregates))
+        except Exception as e:
+            print(f"Error rendering charts: {e}")
+
+    return _render_executor.submit(work)
+
+def render_history_async(history, range_name, on_done):
+    """Render both charts for one of HISTORY_RANGES from a history.RecordHistory.
+
+    The range queries run on the calling thread (a Flet handler thread; the
+    history locks itself against records added on the page loop) and only
+    the rendering goes to the chart worker thread.
+    """
+    granularity, days = HISTORY_RANGES[range_name]
+    start = days_ago(days) if days else None
+    buckets, points = history.series(granularity, start)
+    materials, co2_values = co2_per_material(
+        {material: material_points for material, (_, material_points) in history.material_totals(start).items()})
+
+    def work():
+        try:
+            points_chart = cached_chart('historical_points', _render_historical_chart, buckets, points, BUCKET_LABELS[granularity])
+            on_done(points_chart, cached_chart('co2_by_material', _render_co2_by_material, materials, co2_values))
+        except Exception as e:
+            print(f"Error rendering charts: {e}")
+
+    return _render_executor.submit(work)
@@ -0,0 +1,179 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import cv2
+import numpy as np
+from backends import BACKENDS, DEFAULT_BACKEND, load_backend, static_input_size
+from database import open_for_append
+from detection import container_mapping, filter_boxes, inference_settings, letterbox, points_mapping
+
+# Headless batch classification of image folders and video files:
+#   python classify.py imagenes/ grabaciones/caja3.mp4 -o resultados.jsonl --workers 4
+# Every processed image or video frame becomes one JSON line, so an interrupted
+# run can be resumed with the same command and only the missing items are scored.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+_model = None
+_settings = {}
+
+def _init_worker(backend, size, threads):
+    global _model
+    import torch
+    torch.set_num_threads(threads)
+    _model = load_backend(backend)
+    _settings.update(size=size)
+
+def _classify_batch(items):
+    """Run the model over a batch of (source, frame_number, image) and build the output lines.
+
+    Images are letterboxed to the model input size like the kiosk's frames;
+    boxes are reported in source image pixels.
+    """
+    size = _settings["size"]
+    frames, scales, pads = zip(*(letterbox(image, size, size) for _, _, image in items))
+    results = _model(list(frames), imgsz=size, verbose=False)
+    lines = []
+    for (source, frame_number, _), result, scale, (pad_x, pad_y) in zip(items, results, scales, pads):
+        labels, classes, confidence, xyxy = filter_boxes(_model, result)
+        xyxy = (xyxy - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+        detections = [
+            {
+                "label": label,
+                "confidence": round(score, 4),
+                "points": points_mapping.get(label, 0),
+                "container": container_mapping.get(_model.names[class_id], "desconocido"),
+                "box": [round(v, 1) for v in box],
+            }
+            for label, class_id, score, box in zip(labels.tolist(), classes.tolist(), confidence.tolist(), xyxy.tolist())
+        ]
+        lines.append({"source": source, "frame": frame_number, "detections": detections})
+    return lines
+
+def process_images(paths, batch_size):
+    items = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Error: could not read {path}")
+            continue
+        items.append((path, None, image))
+    lines = []
+    for start in range(0, len(items), batch_size):
+        lines.extend(_classify_batch(items[start:start + batch_size]))
+    return lines
+
+def process_video(path, start, end, stride, done_frames, batch_size):
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    lines, items = [], []
+    for frame_number in range(start, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_number % stride or frame_number in done_frames:
+            continue
+        items.append((path, frame_number, frame))
+        if len(items) == batch_size:
+            lines.extend(_classify_batch(items))
+            items = []
+    if items:
+        lines.extend(_classify_batch(items))
+    cap.release()
+    return lines
+
+def _run_unit(unit):
+    kind, args = unit
+    if kind == "images":
+        return process_images(*args)
+    return process_video(*args)
+
+def collect_inputs(inputs):
+    images, videos = [], []
+    for path in inputs:
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names) if os.path.isdir(path) else [path]
+        for candidate in paths:
+            if candidate.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(candidate)
+            elif candidate.lower().endswith(VIDEO_EXTENSIONS):
+                videos.append(candidate)
+    return images, videos
+
+def load_done(output):
+    """Return the (source, frame) pairs already present in the output file."""
+    done = set()
+    try:
+        with open(output, 'r', encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line of an interrupted run
+                done.add((entry["source"], entry["frame"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+def build_units(images, videos, done, batch_size, stride, chunk_frames):
+    """Split the pending work into units for the worker pool, skipping what is already done."""
+    units = []
+    images = [path for path in images if (path, None) not in done]
+    # Several batches per unit so each worker amortizes the inter-process round trip
+    images_per_unit = batch_size * 4
+    for start in range(0, len(images), images_per_unit):
+        units.append(("images", (images[start:start + images_per_unit], batch_size)))
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        done_frames = {frame for source, frame in done if source == path}
+        for start in range(0, max(frame_count, 1), chunk_frames):
+            end = start + chunk_frames
+            chunk_done = {frame for frame in done_frames if start <= frame < end}
+            if any(frame % stride == 0 and frame not in chunk_done for frame in range(start, end)):
+                units.append(("video", (path, start, end, stride, chunk_done, batch_size)))
+    return units
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify image folders and video files without a camera or GUI")
+    parser.add_argument("inputs", nargs="+", help="Image files, video files or directories")
+    parser.add_argument("-o", "--output", default="classification.jsonl")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--stride", type=int, default=1, help="Classify every Nth video frame")
+    parser.add_argument("--chunk-frames", type=int, default=500, help="Video frames per work unit")
+    parser.add_argument("--size", type=int, default=inference_settings["active_imgsz"],
+                        help="Model input size; images are letterboxed to size x size, like the kiosk's model input")
+    args = parser.parse_args()
+
+    images, videos = collect_inputs(args.inputs)
+    done = load_done(args.output)
+    if done:
+        print(f"Resuming: {len(done)} items already in {args.output}")
+    units = build_units(images, videos, done, args.batch_size, args.stride, args.chunk_frames)
+
+    size = static_input_size(args.backend) or args.size
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    start = time.perf_counter()
+    processed = 0
+    # The last line of an interrupted run may be torn; it is terminated before appending
+    with open_for_append(args.output) as output, multiprocessing.Pool(
+            args.workers, initializer=_init_worker, initargs=(args.backend, size, threads)) as pool:
+        for lines in pool.imap_unordered(_run_unit, units):
+            for line in lines:
+                output.write(json.dumps(line, ensure_ascii=False) + '\n')
+            output.flush()
+            processed += len(lines)
+            elapsed = time.perf_counter() - start
+            print(f"{processed} items, {processed / elapsed:.1f} images/s", end='\r')
+
+    elapsed = time.perf_counter() - start
+    print(f"\nClassified {processed} items in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,416 @@
+import atexit
 import json
+import os
+import socket
+import threading
+from collections import OrderedDict, defaultdict
+from urllib.parse import quote
+import metrics
+from sync import get_sync_queue
+
+RECORDS_PATH = 'records.jsonl'
+LEGACY_RECORDS_PATH = 'records.json'  # Old format: a single JSON array rewritten on every save
+AGGREGATES_PATH = 'records_aggregates.json'
+# Sharded layout: RECORDS_DIR/<kiosk>/<user>.jsonl, each shard with its own aggregates snapshot
+RECORDS_DIR = 'records'
+DEFAULT_USER = 'invitado'  # Owner of records saved with no user, including migrated ones
+# Identity stamped on new records: this kiosk (ECOALDASO_KIOSK, else the host name) and the signed-in user
+kiosk_settings = {"kiosk": os.environ.get("ECOALDASO_KIOSK") or socket.gethostname(), "user": DEFAULT_USER}
+
+
+def open_for_append(path, binary=False):
+    """Open a JSON Lines file for appending, first terminating a line torn by a crash.
+
+    Text files are opened as UTF-8; `binary` opens the file in 'ab' mode.
+    """
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            needs_newline = file.read(1) != b'\n'
+    file = open(path, 'ab') if binary else open(path, 'a', encoding="utf-8")
+    if needs_newline:
+        file.write(b'\n' if binary else '\n')
+        file.flush()
+    return file
+
+
+class RecordAggregates:
+    """Running totals over the record history, updated in O(1) per record.
+
+    `offset` is the size of the records file the totals cover, so a stale
+    snapshot can be brought up to date by replaying only the tail.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.record_count = 0
+        self.month_points = defaultdict(int)
+        self.material_points = defaultdict(int)
+        self.material_counts = defaultdict(int)
+        self.container_counts = defaultdict(int)
+
+    @classmethod
+    def from_records(cls, records):
+        aggregates = cls()
+        for record in records:
+            aggregates.add(record)
+        return aggregates
+
+    def add(self, record):
+        points = record.get('points', 0)
+        label = record.get('label', 'desconocido')
+        self.record_count += 1
+        self.month_points[record['timestamp'][:7]] += points  # YYYY-MM
+        self.material_points[label] += points
+        self.material_counts[label] += 1
+        self.container_counts[record.get('container', 'desconocido')] += 1
+
+    def merge(self, other):
+        """Add another aggregates' totals to these."""
+        self.record_count += other.record_count
+        for name in ("month_points", "material_points", "material_counts", "container_counts"):
+            totals = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                totals[key] += value
+
+    def to_dict(self):
+        return {
+            "offset": self.offset,
+            "record_count": self.record_count,
+            "month_points": self.month_points,
+            "material_points": self.material_points,
+            "material_counts": self.material_counts,
+            "container_counts": self.container_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        aggregates.offset = data["offset"]
+        aggregates.record_count = data["record_count"]
+        for name in ("month_points", "material_points", "material_counts", "container_counts"):
+            getattr(aggregates, name).update(data[name])
+        return aggregates
+
+
+class RecordStore:
+    """Append-only JSON Lines record store.
+
+    Each record is one line, so saving a detection is a single O(1) write
+    instead of a full parse and rewrite of the history. Writes are flushed
+    immediately and fsync'd in batches (every `fsync_every` records or after
+    `fsync_interval` seconds), and a torn last line left by a crash is
+    skipped on load.
+    """
+
+    def __init__(self, path=RECORDS_PATH, legacy_path=LEGACY_RECORDS_PATH, aggregates_path=AGGREGATES_PATH,
+                 fsync_every=10, fsync_interval=2.0):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.aggregates_path = aggregates_path
+        self._aggregates = None
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._pending = 0
+        self._timer = None
+        self._lock = threading.Lock()
+        self.migrate()
+
+    def migrate(self):
+        """Convert a legacy records.json array into the JSON Lines file, once."""
+        if self.legacy_path is None or os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding="utf-8") as file:
+                records = json.load(file)
+        except json.JSONDecodeError:
+            records = []
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        # Snapshot the migrated history so the next launch does not replay it
+        self._aggregates = RecordAggregates.from_records(records)
+        self._aggregates.offset = os.path.getsize(self.path)
+        self._save_aggregates()
+        os.replace(self.legacy_path, self.legacy_path + '.migrated')
+        print(f"Migrated {len(records)} records from {self.legacy_path} to {self.path}")
+
+    def load(self):
+        """Read every record in insertion order."""
+        return list(self.iter_records())
+
+    def iter_records(self):
+        """Yield every record in insertion order, reading the file as it goes."""
+        return self._read_from(0)
+
+    def get_aggregates(self):
+        """Return the running aggregates, loading the persisted snapshot on first use.
+
+        Only records appended after the snapshot was written are replayed,
+        so the cost does not grow with the size of the history.
+        """
+        with self._lock:
+            if self._aggregates is None:
+                self._aggregates = self._load_aggregates()
+            return self._aggregates
+
+    def _load_aggregates(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        aggregates = None
+        try:
+            with open(self.aggregates_path, 'r', encoding="utf-8") as file:
+                aggregates = RecordAggregates.from_dict(json.load(file))
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+        if aggregates is None or aggregates.offset > size:
+            aggregates = RecordAggregates()  # Missing or stale snapshot: rebuild from scratch
+        replayed = aggregates.offset != size
+        for record in self._read_from(aggregates.offset):
+            aggregates.add(record)
+        aggregates.offset = size
+        if replayed:
+            # Persist what was replayed, so a shard nobody appends to is not rescanned on every launch
+            try:
+                self._save_aggregates(aggregates)
+            except OSError as e:
+                print(f"Error saving record aggregates: {e}")
+        return aggregates
+
+    def _save_aggregates(self, aggregates=None):
+        tmp_path = self.aggregates_path + '.tmp'
+        with open(tmp_path, 'w', encoding="utf-8") as file:
+            json.dump((aggregates or self._aggregates).to_dict(), file, ensure_ascii=False)
+        os.replace(tmp_path, self.aggregates_path)
+
+    def _read_from(self, offset):
+        try:
+            with open(self.path, 'rb') as file:
+                file.seek(offset)
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        print(f"Skipping corrupt record line in {self.path}")
+        except FileNotFoundError:
+            return
+
+    def append(self, record):
+        """Append one record; it is on disk after the next batched fsync."""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        self.get_aggregates()
+        with metrics.timer("record_append"), self._lock:
+            file = self._open()
+            file.write(line)
+            file.flush()
+            self._aggregates.add(record)
+            self._aggregates.offset = os.fstat(file.fileno()).st_size
+            self._pending += 1
+            metrics.inc("records_appended")
+            if self._pending >= self.fsync_every:
+                self._sync_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self):
+        """Force pending records to disk."""
+        with self._lock:
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open_for_append(self.path)
+        return self._file
+
+    def _sync_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._file is not None and self._pending:
+            self._file.flush()
+            with metrics.timer("record_fsync"):
+                os.fsync(self._file.fileno())
+            metrics.inc("record_fsyncs")
+            # Persisted after the records so the snapshot never covers unsynced data
+            self._save_aggregates()
+        self._pending = 0
+
+
+class ShardedRecordStore:
+    """Records sharded by kiosk and user, one RecordStore per shard.
+
+    A user's totals are the aggregates snapshot of their shard in every
+    kiosk directory, so a profile loads in the same time however many
+    records other users have. Writes from this kiosk go to
+    RECORDS_DIR/<kiosk>/; directories of other kiosks (e.g. collected by
+    the central store) are only read. At most `max_open_shards` shards keep
+    an open file; the least recently used one is synced and closed.
+    """
+
+    def __init__(self, root=RECORDS_DIR, kiosk='kiosk', max_open_shards=32):
+        self.root = root
+        self.kiosk = kiosk
+        self.max_open_shards = max_open_shards
+        self._shards = OrderedDict()  # user -> RecordStore
+        self._aggregates = None  # All shards of this kiosk, kept current by append()
+        self._lock = threading.Lock()
+        self.migrate()
+
+    def _shard_path(self, user, kiosk=None):
+        return os.path.join(self.root, kiosk or self.kiosk, quote(user, safe='') + '.jsonl')
+
+    def _open_shard(self, path, legacy_path=None):
+        return RecordStore(path, legacy_path, path[:-len('.jsonl')] + '.aggregates.json')
+
+    def migrate(self):
+        """Move the unsharded records file (and legacy records.json) into the default user's shard, once."""
+        shard_path = self._shard_path(DEFAULT_USER)
+        if not (os.path.exists(RECORDS_PATH) or os.path.exists(LEGACY_RECORDS_PATH)):
+            return
+        if os.path.exists(shard_path):
+            # Written by something that bypassed this module after the migration; never merged silently
+            print(f"Warning: {RECORDS_PATH} or {LEGACY_RECORDS_PATH} found after migrating to {self.root}; "
+                  f"its records are not loaded. Save records through database.insert_record_into_json.")
+            return
+        RecordStore(RECORDS_PATH, LEGACY_RECORDS_PATH, AGGREGATES_PATH)  # Converts records.json if needed
+        if not os.path.exists(RECORDS_PATH):
+            return
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        os.replace(RECORDS_PATH, shard_path)
+        if os.path.exists(AGGREGATES_PATH):
+            # Same file contents, so the snapshot offset is still valid
+            os.replace(AGGREGATES_PATH, self._open_shard(shard_path).aggregates_path)
+        print(f"Moved {RECORDS_PATH} to the shard of user {DEFAULT_USER} in {shard_path}")
+
+    def shard(self, user):
+        """Return the RecordStore of one of this kiosk's users."""
+        with self._lock:
+            store = self._shards.get(user)
+            if store is None:
+                path = self._shard_path(user)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                store = self._shards[user] = self._open_shard(path)
+                if len(self._shards) > self.max_open_shards:
+                    _, evicted = self._shards.popitem(last=False)
+                    evicted.close()
+            self._shards.move_to_end(user)
+            return store
+
+    def _local_shard_paths(self):
+        directory = os.path.join(self.root, self.kiosk)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.jsonl'))
+
+    def load(self):
+        """Read every record of this kiosk, oldest first."""
+        records = []
+        for path in self._local_shard_paths():
+            records.extend(self._open_shard(path).load())
+        records.sort(key=lambda record: record.get('timestamp', ''))
+        return records
+
+    def iter_records(self):
+        """Yield every record of this kiosk shard by shard, not in timestamp order, without holding them all."""
+        for path in self._local_shard_paths():
+            yield from self._open_shard(path).iter_records()
+
+    def get_aggregates(self):
+        """Return the aggregates of all this kiosk's shards, merged from their snapshots."""
+        with self._lock:
+            if self._aggregates is None:
+                aggregates = RecordAggregates()
+                for path in self._local_shard_paths():
+                    open_store = next((store for store in self._shards.values() if store.path == path), None)
+                    aggregates.merge((open_store or self._open_shard(path)).get_aggregates())
+                self._aggregates = aggregates
+            return self._aggregates
+
+    def user_aggregates(self, user):
+        """Return one user's aggregates across every kiosk directory under the root."""
+        aggregates = RecordAggregates()
+        kiosks = os.listdir(self.root) if os.path.isdir(self.root) else []
+        for kiosk in kiosks:
+            if kiosk == self.kiosk:
+                aggregates.merge(self.shard(user).get_aggregates())
+                continue
+            path = self._shard_path(user, kiosk)
+            if os.path.exists(path):
+                aggregates.merge(self._open_shard(path).get_aggregates())
+        return aggregates
+
+    def append(self, record):
+        """Append a record to the shard of its user."""
+        self.get_aggregates()
+        self.shard(record.get('user') or DEFAULT_USER).append(record)
+        with self._lock:
+            self._aggregates.add(record)
+
+    def sync(self):
+        with self._lock:
+            for store in self._shards.values():
+                store.sync()
+
+    def close(self):
+        with self._lock:
+            for store in self._shards.values():
+                store.close()
+            self._shards.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_record_store():
+    """Return the shared record store of this kiosk, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ShardedRecordStore(kiosk=kiosk_settings["kiosk"])
+            atexit.register(_store.close)
+        return _store
 
 def load_records_from_json():
-    with open('records.json', 'r',encoding="utf-8") as file:
-        return json.load(file)
+    return get_record_store().load()
+
+def iter_records_from_json():
+    return get_record_store().iter_records()
+
+def load_record_aggregates():
+    return get_record_store().get_aggregates()
+
+def load_user_aggregates(user):
+    return get_record_store().user_aggregates(user)
 
 def insert_record_into_json(record):
-    with open('records.json', 'r+', encoding="utf-8") as file:
-        data = json.load(file)
-        data.append(record)
-        file.seek(0)
-        json.dump(data, file, indent=4)
+    """Insert a record into the record store."""
+    try:
+        get_record_store().append(record)
+        print("Record successfully saved.")
+    except Exception as e:
+        print(f"Error saving record: {e}")
+        return
+    try:
+        sync_queue = get_sync_queue()
+        if sync_queue is not None:
+            sync_queue.enqueue(record)
+    except Exception as e:
+        print(f"Error queueing record for sync: {e}")
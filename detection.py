@@ -1,14 +1,27 @@
 import cv2
 import time
-from ultralytics import YOLO
-import json
-from utils import update_record_list
-import base64
+import os
+import threading
+import uuid
 import numpy as np
-from threading import Thread
-
-# Load YOLO model
-model = YOLO('besto.pt')
+import metrics
+from backends import DEFAULT_BACKEND, load_backend, static_input_size
+from tracking import Tracker
+from motion import MotionGate
+from presenter import get_presenter, letterbox
+from database import kiosk_settings
+from inference_pool import InferencePool
+
+# YOLO model, loaded on a background thread by load_model_async()
+inference_backend = DEFAULT_BACKEND  # See backends.BACKENDS
+model = None
+model_state = "pendiente"  # pendiente -> cargando -> listo | error
+model_error = None
+model_timings = {}  # Seconds spent importing ultralytics, loading the weights and warming up
+_model_ready = threading.Event()
+_model_lock = threading.Lock()
+_model_thread = None
+_model_listeners = []
 
 # Mappings for labels, points, containers, and instructions
 points_mapping = {
@@ -47,218 +60,343 @@ instructions_mapping = {
     "Papel": "Deposítalo en el contenedor azul, si esta sucio depositalo en el organico. Reciclar papel reduce la tala de árboles y disminuye el impacto ambiental de la producción de papel nuevo."
 }
 
-# Global variables
-camera_running = False
-inference_running = False
-freeze_frame = False
-last_frame = None
-frame_count_threshold = 10
-detection_counts = {}
-frame_skip = 5  # Number of frames to skip
+# Detection settings
+tracker_settings = {"min_hits": 3, "confirm_score": 0.6}  # See tracking.Tracker
+# Frame presentation: JPEG quality, display FPS cap and optional local MJPEG port (see presenter.FramePresenter)
+display_settings = {"jpeg_quality": 80, "max_fps": 15, "mjpeg_port": None}
+motion_settings = {"pixel_threshold": 25, "min_changed_fraction": 0.01, "cooldown": 2.0}  # See motion.MotionGate
+# Model input: optional region of interest as fractions (x, y, width, height) of the camera
+# frame, e.g. (0.25, 0.3, 0.5, 0.7) for the bin drop zone, and the square input size used while
+# nothing is being tracked (idle_imgsz) or while a candidate object awaits confirmation (active_imgsz).
+# Backends exported with a fixed input shape (backends.BACKENDS "static_imgsz") always use that size.
+inference_settings = {"roi": None, "idle_imgsz": 320, "active_imgsz": 640}
+# Post-processing of model boxes: minimum confidence (overridable per Spanish label) and the IoU
+# above which the lower-confidence of two same-class boxes is dropped
+postprocess_settings = {"min_confidence": 0.25, "label_min_confidence": {}, "nms_iou": 0.5}
+# Optional inference in worker processes fed through shared memory (see inference_pool.InferencePool);
+# 0 workers runs the model in this process
+process_settings = {"workers": int(os.environ.get("ECOALDASO_INFERENCE_PROCESSES", "0")), "slots": 8}
 
 def create_black_background(width=420, height=420):
     """Create a black background with specified dimensions."""
     return np.zeros((height, width, 3), dtype=np.uint8)
 
-def set_image_control(image_control, image=None, width=420, height=420):
-    """Set the image for the control with optional resizing."""
+def roi_bounds(frame, roi=None):
+    """Pixel bounds (x1, y1, x2, y2) of a fractional region of interest; the whole frame if None."""
+    h, w = frame.shape[:2]
+    if roi is None:
+        return 0, 0, w, h
+    x, y, roi_w, roi_h = roi
+    x1, y1 = min(max(0, int(x * w)), w - 1), min(max(0, int(y * h)), h - 1)
+    x2, y2 = max(x1 + 1, min(w, int((x + roi_w) * w))), max(y1 + 1, min(h, int((y + roi_h) * h)))
+    return x1, y1, x2, y2
+
+def crop_roi(frame):
+    """View of the frame inside inference_settings["roi"]."""
+    x1, y1, x2, y2 = roi_bounds(frame, inference_settings["roi"])
+    return frame[y1:y2, x1:x2]
+
+def prepare_frame(frame, width=420, height=420, imgsz=None, input_buffer=None):
+    """Build the displayed frame and the model input for one camera frame.
+
+    The display is the whole frame letterboxed to width x height; the model
+    input is only the region of interest, letterboxed to imgsz x imgsz.
+    Returns (display, model input, transform), where the transform
+    (factor, offset_x, offset_y) maps model input pixels to display pixels.
+    The model input is written into `input_buffer` when given.
+    """
+    imgsz = imgsz or inference_settings["idle_imgsz"]
+    display, scale, (pad_x, pad_y) = letterbox(frame, width, height)
+    x1, y1, x2, y2 = roi_bounds(frame, inference_settings["roi"])
+    model_input, input_scale, (input_pad_x, input_pad_y) = letterbox(frame[y1:y2, x1:x2], imgsz, imgsz, input_buffer)
+    factor = scale / input_scale
+    transform = (factor, pad_x + x1 * scale - input_pad_x * factor, pad_y + y1 * scale - input_pad_y * factor)
+    if inference_settings["roi"] is not None:
+        cv2.rectangle(display, (round(pad_x + x1 * scale), round(pad_y + y1 * scale)),
+                      (round(pad_x + x2 * scale) - 1, round(pad_y + y2 * scale) - 1), (128, 128, 128), 1)
+    return display, model_input, transform
+
+def set_image_control(image_control, image=None, width=420, height=420, force=False):
+    """Set the image for the control with optional resizing.
+
+    Goes through the control's FramePresenter, so unchanged frames and frames
+    over display_settings["max_fps"] are skipped unless `force` is set.
+    """
     if image is None:
         image = create_black_background(width, height)
-    if image.shape[1] != width or image.shape[0] != height:
-        image = cv2.resize(image, (width, height))
-    _, buffer = cv2.imencode('.jpg', image)
-    img_str = base64.b64encode(buffer).decode()
-    image_control.src_base64 = img_str
-    image_control.update()
+        force = True
+    presenter = get_presenter(image_control, width, height, **display_settings)
+    return presenter.show(image, force)
 
 def clear_display(image_control):
     """Clear the display by setting a black background."""
-    set_image_control(image_control, create_black_background())
-
-def initialize_detection():
-    """Initialize detection variables."""
-    global camera_running, inference_running, freeze_frame, last_frame, detection_counts
-    camera_running = False
-    inference_running = True
-    freeze_frame = False
-    last_frame = None
-    detection_counts = {}
-
-def cleanup_detection(cap):
-    """Cleanup resources after detection."""
-    global inference_running
-    if cap.isOpened():
-        cap.release()
-    inference_running = False
-
-def detect_objects(instruction_label, detection_text, image_control, object_records, record_list, page):
-    """Detect objects and update display accordingly."""
-    global camera_running, inference_running, freeze_frame, last_frame, detection_counts
-
-    initialize_detection()
-
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Could not open webcam")
-        cleanup_detection(cap)
-        return
-
-    width, height = 420, 420
-    clear_display(image_control)
-    detection_text.value = ""
-    instruction_label.value = "Instrucciónes: None"
-    page.update()
-
-    frame_count = 0
-
-    while inference_running:
-        if freeze_frame:
-            if last_frame is not None:
-                set_image_control(image_control, last_frame, width, height)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-            continue
-
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Failed to capture image")
-            break
-
-        frame_count += 1
-        if frame_count % frame_skip != 0:
-            continue
-
-        frame = cv2.resize(frame, (width, height))
-        results = model(frame)
-        detected_objects = []
-        current_detected_labels = []
-
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-                detected_label = names_esp_mapping.get(model.names[int(box.cls)], "desconocido")
-                confidence = float(box.conf)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                # cv2.putText(frame, f"{detected_label} {confidence:.2f}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                detected_objects.append(detected_label)
-                current_detected_labels.append(detected_label)
-
-        for detected_label in current_detected_labels:
-            if detected_label in detection_counts:
-                detection_counts[detected_label] += 1
-                if detection_counts[detected_label] >= frame_count_threshold:
-                    freeze_frame = True
-                    last_frame = frame.copy()
-                    points = points_mapping.get(detected_label, 0)
-                    container = container_mapping.get(detected_label, "desconocido")
-                    instruction = instructions_mapping.get(detected_label, "Instrucción no disponible.")
-                    detection_text.value = f"Objeto detectado: {detected_label} ({confidence:.2f})"
-                    instruction_label.value = f"Instrucciónes: {instruction}"
-                    object_record = {
-                        "label": detected_label,
-                        "confidence": confidence,
-                        "points": points,
-                        "container": container,
-                        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
-                    }
-                    object_records.append(object_record)
-                    update_record_list(record_list, object_records, page)
-                    page.update()
-                    insert_record_into_json(object_record)
-
-                    cleanup_detection(cap)
-                    return
-
-            else:
-                detection_counts[detected_label] = 1
-
-        for detected_label in list(detection_counts.keys()):
-            if detected_label not in current_detected_labels:
-                detection_counts[detected_label] = 0
-
-        if not freeze_frame:
-            if detected_objects:
-                detection_text.value = "Parece que es: " + ", ".join(detected_objects)
-                page.update()
-
-            set_image_control(image_control, frame, width, height)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cleanup_detection(cap)
-
-def insert_record_into_json(record):
-    """Insert a record into a JSON file."""
-    try:
+    set_image_control(image_control, create_black_background(), force=True)
+
+class DetectionState:
+    """Confirmation state of one capture source.
+
+    Detections are followed by a Tracker, and an object is confirmed as
+    soon as its track has enough evidence; the source then freezes on that
+    frame. Two objects of the same class are separate tracks.
+    """
+
+    def __init__(self, source=0):
+        self.source = source
+        self.freeze_frame = False
+        self.last_frame = None
+        self.tracker = Tracker(**tracker_settings)
+        self.motion_gate = MotionGate(**motion_settings)
+
+    def input_size(self):
+        """Model input size: larger while a candidate object is being tracked towards confirmation."""
+        static = static_input_size(inference_backend)
+        if static:
+            return static
+        return inference_settings["active_imgsz"] if self.tracker.tracks else inference_settings["idle_imgsz"]
+
+    def update(self, frame, detections):
+        """Feed one processed frame; return (label, confidence) when an object is confirmed."""
+        confirmed = self.tracker.update(detections)
+        if not confirmed:
+            return None
+        track = confirmed[0]
+        self.freeze_frame = True
+        self.last_frame = frame.copy()
+        return track.label, track.confidence
+
+    def reset(self):
+        self.freeze_frame = False
+        self.last_frame = None
+        self.tracker.reset()
+        self.motion_gate.reset()
+
+def build_record(detected_label, confidence):
+    """Build the record stored for a confirmed detection."""
+    return {
+        "id": uuid.uuid4().hex,  # Lets the central store drop records resent by the sync queue
+        "label": detected_label,
+        "confidence": confidence,
+        "points": points_mapping.get(detected_label, 0),
+        "container": container_mapping.get(detected_label, "desconocido"),
+        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())),
+        "user": kiosk_settings["user"],
+        "kiosk": kiosk_settings["kiosk"],
+    }
+
+def _set_model_state(state, error=None):
+    global model_state, model_error
+    model_state = state
+    model_error = error
+    for listener in list(_model_listeners):
         try:
-            with open('records.json', 'r') as file:
-                try:
-                    data = json.load(file)
-                except json.JSONDecodeError:
-                    data = []
-        except FileNotFoundError:
-            data = []
-
-        data.append(record)
-
-        with open('records.json', 'w') as file:
-            json.dump(data, file, indent=4)
-
-        print("Record successfully saved.")
-
+            listener(state)
+        except Exception as e:
+            print(f"Error notifying model state: {e}")
+
+def _load_model():
+    """Load the weights, here or in the inference workers, and run a warm-up inference."""
+    global model
+    _set_model_state("cargando")
+    try:
+        if process_settings["workers"]:
+            # Workers load and warm up their own copy of the model
+            start = time.perf_counter()
+            loaded = InferencePool(process_settings["workers"], inference_backend, process_settings["slots"],
+                                   max(inference_settings["idle_imgsz"], inference_settings["active_imgsz"],
+                                       static_input_size(inference_backend) or 0))
+            loaded.start(postprocess_settings)
+            model_timings["workers"] = time.perf_counter() - start
+        else:
+            # Only imported in this process when it runs the model itself; it pulls in torch
+            start = time.perf_counter()
+            import ultralytics
+            model_timings["import"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded = load_backend(inference_backend)
+            model_timings["load"] = time.perf_counter() - start
+
+            # The first inference initializes lazy state in torch, so pay for it before the user does
+            start = time.perf_counter()
+            loaded(create_black_background(420, 420), verbose=False)
+            model_timings["warmup"] = time.perf_counter() - start
+
+        model = loaded
+        print(f"Model ready ({inference_backend}): " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in model_timings.items()))
+        _set_model_state("listo")
     except Exception as e:
-        print(f"Error saving record: {e}")
-
-def camera(image_control, page):
-    """Start camera feed and display images."""
-    global camera_running
-    camera_running = True
-
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Could not open webcam")
-        camera_running = False
-        return
-
-    width, height = 420, 420
-    set_image_control(image_control, create_black_background(width, height))
-    page.update()
-
-    while camera_running:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Failed to capture image")
-            break
-
-        frame = cv2.resize(frame, (width, height))
-        set_image_control(image_control, frame, width, height)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            camera_running = False
-            break
-
-    if cap.isOpened():
-        cap.release()
-    clear_display(image_control)
-
-def on_button_press(instruction_label, detection_text, image_control, object_records, record_list, page):
-    """Handle button press to start object detection."""
-    global camera_running, freeze_frame, detection_counts, inference_running
-    # Stop any ongoing processes
-    camera_running = False
-    freeze_frame = False
-    last_frame = None
-    detection_counts = {}
-    inference_running = True  # Start new inference
-
-    # Clear the image display
-    clear_display(image_control)
-    detection_text.value = ""
-    instruction_label.value = "Instrucciónes: None"
-    page.update()
-
-    # Start object detection in a separate thread to avoid blocking the main thread
-    detection_thread = Thread(target=detect_objects, args=(instruction_label, detection_text, image_control, object_records, record_list, page))
-    detection_thread.start()
+        print(f"Error loading model: {e}")
+        _set_model_state("error", str(e))
+    finally:
+        _model_ready.set()
+
+def load_model_async(on_state_change=None):
+    """Start loading the model in the background; safe to call more than once.
+
+    `on_state_change(state)` is called on every state transition.
+    """
+    global _model_thread
+    with _model_lock:
+        if on_state_change is not None:
+            _model_listeners.append(on_state_change)
+            on_state_change(model_state)
+        if _model_thread is None:
+            _model_thread = threading.Thread(target=_load_model, daemon=True)
+            _model_thread.start()
+
+def wait_for_model(timeout=None):
+    """Start loading the model if needed and wait for it.
+
+    Returns True once the model is loaded, False on timeout or if loading failed.
+    """
+    load_model_async()
+    return _model_ready.wait(timeout) and model is not None
+
+def model_load_finished():
+    """True once loading has ended, whether the model loaded or failed; see model_state."""
+    return _model_ready.is_set()
+
+def get_model(timeout=None):
+    """Return the loaded model, waiting for the background load if needed."""
+    load_model_async()
+    if not _model_ready.wait(timeout) or model is None:
+        raise RuntimeError(model_error or "Model is not loaded")
+    return model
+
+def process_batch(frames, width=420, height=420, imgsz=None):
+    """Letterbox frames, run the model once over their regions of interest and draw the detected boxes.
+
+    Returns a list of (annotated frame, [(label, confidence, box), ...]) in input order,
+    with boxes in display coordinates.
+    """
+    model = get_model()
+    imgsz = static_input_size(inference_backend) or imgsz or inference_settings["idle_imgsz"]
+    if isinstance(model, InferencePool):
+        return _process_batch_in_pool(model, frames, width, height, imgsz)
+    with metrics.timer("resize"):
+        displays, inputs, transforms = zip(*(prepare_frame(frame, width, height, imgsz) for frame in frames))
+    with metrics.timer("inference"):
+        results = model(list(inputs), imgsz=imgsz)
+    with metrics.timer("postprocess"):
+        processed = annotate_results(model, displays, results, transforms)
+    metrics.inc("inferred_frames", len(frames))
+    return processed
+
+def _process_batch_in_pool(pool, frames, width, height, imgsz):
+    """process_batch for an InferencePool: model inputs are letterboxed straight into shared memory."""
+    processed = []
+    for start in range(0, len(frames), pool.slots):
+        chunk = frames[start:start + pool.slots]
+        slots = []
+        try:
+            for _ in chunk:
+                slots.append(pool.acquire())
+            with metrics.timer("resize"):
+                displays, _, transforms = zip(*(prepare_frame(frame, width, height, imgsz, pool.input_view(slot, imgsz))
+                                                for frame, slot in zip(chunk, slots)))
+        except Exception:
+            for slot in slots:
+                pool.release(slot)
+            raise
+        with metrics.timer("inference"):
+            outputs = pool.run(slots, imgsz)
+        with metrics.timer("postprocess"):
+            processed.extend(draw_detections(displays, outputs, transforms))
+    metrics.inc("inferred_frames", len(frames))
+    return processed
+
+_class_tables = (None, None)  # (model.names, Spanish label per class id)
+
+def _class_labels(names):
+    """Spanish label per class id as an array, built once per model."""
+    global _class_tables
+    if _class_tables[0] is not names:
+        labels = np.array([names_esp_mapping.get(names.get(class_id), "desconocido")
+                           for class_id in range(max(names) + 1)], dtype=object)
+        _class_tables = (names, labels)
+    return _class_tables[1]
+
+def _per_class_nms(xyxy, confidence, classes, iou_threshold):
+    """Indices of the boxes kept by greedy NMS applied within each class."""
+    # Shift every class to its own region so boxes of different classes never overlap
+    shifted = xyxy + (classes * (xyxy.max() + 1))[:, None]
+    areas = (shifted[:, 2] - shifted[:, 0]) * (shifted[:, 3] - shifted[:, 1])
+    order = np.argsort(-confidence)
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        top_left = np.maximum(shifted[best, :2], shifted[rest, :2])
+        bottom_right = np.minimum(shifted[best, 2:], shifted[rest, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+def filter_boxes(model, result):
+    """Pull a result's boxes as arrays and apply the thresholds and NMS of postprocess_settings.
+
+    Returns (labels, class ids, confidences, xyxy boxes) as NumPy arrays.
+    """
+    boxes = result.boxes.cpu().numpy()
+    xyxy = boxes.xyxy.astype(np.float32, copy=False)
+    classes = boxes.cls.astype(np.intp)
+    confidence = boxes.conf.astype(np.float32, copy=False)
+    labels = _class_labels(model.names)[classes]
+
+    thresholds = np.full(len(labels), postprocess_settings["min_confidence"], dtype=np.float32)
+    for label, threshold in postprocess_settings["label_min_confidence"].items():
+        thresholds[labels == label] = threshold
+    keep = confidence >= thresholds
+    xyxy, classes, confidence, labels = xyxy[keep], classes[keep], confidence[keep], labels[keep]
+    if len(labels) > 1:
+        keep = _per_class_nms(xyxy, confidence, classes, postprocess_settings["nms_iou"])
+        xyxy, classes, confidence, labels = xyxy[keep], classes[keep], confidence[keep], labels[keep]
+    return labels, classes, confidence, xyxy
+
+def annotate_results(model, frames, results, transforms=None):
+    """Map YOLO results to (label, confidence, box) detections and draw the boxes on the frames.
+
+    `transforms` holds one (factor, offset_x, offset_y) per frame mapping result
+    coordinates to frame coordinates (see prepare_frame); None means identity.
+    """
+    outputs = []
+    for result in results:
+        labels, _, confidence, xyxy = filter_boxes(model, result)
+        outputs.append((labels, confidence, xyxy))
+    return draw_detections(frames, outputs, transforms)
+
+def draw_detections(frames, outputs, transforms=None):
+    """Draw filtered (labels, confidences, boxes) on their frames; see annotate_results."""
+    processed = []
+
+    for index, (frame, (labels, confidence, xyxy)) in enumerate(zip(frames, outputs)):
+        if not len(labels):
+            processed.append((frame, []))
+            continue
+        factor, offset_x, offset_y = transforms[index] if transforms else (1.0, 0.0, 0.0)
+        boxes = (xyxy * factor + np.array([offset_x, offset_y, offset_x, offset_y], dtype=np.float32)).astype(np.int32)
+        # All rectangles in one call, as closed 4-point polylines
+        corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        cv2.polylines(frame, list(corners), True, (0, 255, 0), 2)
+        detections = list(zip(labels.tolist(), confidence.tolist(), map(tuple, boxes.tolist())))
+        processed.append((frame, detections))
+
+    return processed
+
+def process_frame(frame, width=420, height=420, imgsz=None):
+    """Letterbox a frame, run the model on its region of interest and draw the detected boxes.
+
+    Returns the annotated frame and a list of (label, confidence, box) tuples.
+    """
+    return process_batch([frame], width, height, imgsz)[0]
+
+def process_gated_frame(frame, motion_gate, width=420, height=420, imgsz=None):
+    """Like process_frame, but skips inference while the region of interest is static.
+
+    Gated frames are returned letterboxed with None instead of a detection list.
+    """
+    if not motion_gate.check(crop_roi(frame)):
+        metrics.inc("gated_frames")
+        return letterbox(frame, width, height)[0], None
+    return process_frame(frame, width, height, imgsz)
@@ -0,0 +1,166 @@
+import queue
+import sys
+import threading
+import time
+import cv2
+from detection import DetectionState, build_record, crop_roi, get_model, load_model_async, process_batch
+from database import insert_record_into_json
+from pipeline import RateMeter, put_latest
+
+
+class CameraSource:
+    """One capture source: its camera, latest-frame slot and confirmation state."""
+
+    def __init__(self, source_id, cap):
+        self.source_id = source_id
+        self.cap = cap
+        self.frames = queue.Queue(maxsize=1)
+        self.state = DetectionState(source_id)
+        self.capture_rate = RateMeter()
+        self.dropped_frames = 0
+        self.frozen_until = 0.0
+        self.error = None
+
+    def stats(self):
+        return {
+            "capture_fps": round(self.capture_rate.fps, 1),
+            "captured_frames": self.capture_rate.count,
+            "dropped_frames": self.dropped_frames,
+            **self.state.motion_gate.stats(),
+            "error": self.error,
+        }
+
+
+class MultiCameraEngine:
+    """Runs detection for several cameras with one batched model call per round.
+
+    Each source has its own capture thread that keeps only its freshest frame.
+    A single scheduler thread collects the latest frame of every source that
+    is not frozen and not gated as static by its MotionGate, runs them through the model as one batch and feeds each
+    result to that source's DetectionState. Confirmed detections are saved
+    to the record store and reported via `on_confirmed(source_id, record)`;
+    the source then stays frozen for `freeze_seconds` before resuming.
+    """
+
+    def __init__(self, sources, on_frame=None, on_confirmed=None, width=420, height=420, freeze_seconds=3.0):
+        # Camera indices/URLs are opened here; a {source_id: capture} dict is used as-is
+        if not isinstance(sources, dict):
+            sources = {source_id: cv2.VideoCapture(source_id) for source_id in sources}
+        self.sources = {source_id: CameraSource(source_id, cap) for source_id, cap in sources.items()}
+        self.on_frame = on_frame
+        self.on_confirmed = on_confirmed
+        self.width = width
+        self.height = height
+        self.freeze_seconds = freeze_seconds
+        self.inference_rate = RateMeter()
+        self.batched_frames = 0
+        self._frame_ready = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        load_model_async()
+        for source in self.sources.values():
+            thread = threading.Thread(target=self._capture_loop, args=(source,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._scheduler_loop, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._frame_ready.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        for source in self.sources.values():
+            if source.cap.isOpened():
+                source.cap.release()
+
+    def stats(self):
+        batches = self.inference_rate.count
+        return {
+            "batches": batches,
+            "batch_fps": round(self.inference_rate.fps, 1),
+            "mean_batch_size": round(self.batched_frames / batches, 2) if batches else 0.0,
+            "sources": {source_id: source.stats() for source_id, source in self.sources.items()},
+        }
+
+    def _capture_loop(self, source):
+        if not source.cap.isOpened():
+            source.error = "Could not open camera"
+            print(f"Error: Could not open camera {source.source_id}")
+            return
+        while not self._stop.is_set():
+            ret, frame = source.cap.read()
+            if not ret:
+                source.error = "Failed to capture image"
+                print(f"Error: Failed to capture image from camera {source.source_id}")
+                break
+            source.capture_rate.tick()
+            source.dropped_frames += put_latest(source.frames, frame)
+            self._frame_ready.set()
+
+    def _next_batch(self):
+        now = time.monotonic()
+        batch = []
+        for source in self.sources.values():
+            try:
+                frame = source.frames.get_nowait()
+            except queue.Empty:
+                continue
+            if source.state.freeze_frame:
+                if now < source.frozen_until:
+                    continue
+                source.state.reset()
+            if not source.state.motion_gate.check(crop_roi(frame)):
+                continue
+            batch.append((source, frame))
+        return batch
+
+    def _scheduler_loop(self):
+        try:
+            get_model()
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            return
+
+        while not self._stop.is_set():
+            self._frame_ready.wait(timeout=0.1)
+            self._frame_ready.clear()
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            # One input size per batch: the largest any source currently asks for
+            imgsz = max(source.state.input_size() for source, _ in batch)
+            processed = process_batch([frame for _, frame in batch], self.width, self.height, imgsz)
+            self.inference_rate.tick()
+            self.batched_frames += len(batch)
+
+            for (source, _), (frame, detections) in zip(batch, processed):
+                if self.on_frame is not None:
+                    self.on_frame(source.source_id, frame, detections)
+                confirmed = source.state.update(frame, detections)
+                if confirmed is None:
+                    continue
+                source.frozen_until = time.monotonic() + self.freeze_seconds
+                record = build_record(*confirmed)
+                record["source"] = source.source_id
+                insert_record_into_json(record)
+                if self.on_confirmed is not None:
+                    self.on_confirmed(source.source_id, record)
+
+
+if __name__ == "__main__":
+    # Headless multi-bin station: python engine.py 0 1 2
+    camera_ids = [int(arg) for arg in sys.argv[1:]] or [0]
+    engine = MultiCameraEngine(camera_ids, on_confirmed=lambda source_id, record: print(f"[{source_id}] {record}"))
+    engine.start()
+    try:
+        while True:
+            time.sleep(10)
+            print(engine.stats())
+    except KeyboardInterrupt:
+        engine.stop()
@@ -2,31 +2,49 @@ import cv2
 import base64
 import numpy as np
 import json
-#quiero guardar en un archivo json llamaado recursos.json la siguiente estructura de datos
-
-
-
-user_logo_path = "imagenes/user.png"  # Ruta a tu logo de usuario
-with open(user_logo_path, "rb") as image_file:
-    user_logo_str = base64.b64encode(image_file.read()).decode()
-
-#Guardar el string en un archivo json
-data_struc = {"name": "user_logo",
-              "imagen": user_logo_str}
-
-with open("recursos.json", "w") as file:
-    json.dump(data_struc, file, indent=4)
-
-
-home_image_path = "imagenes/contenedores.jpg"  # Ruta a tu imagen de inicio
-with open(home_image_path, "rb") as image_file:
-    home_image_str = base64.b64encode(image_file.read()).decode()
-
-#Guardar el string en recursos.json
-data_struc = {"name": "home_image",
-              "imagen": home_image_str}
-
-with open("recursos.json", "a") as file:
-    json.dump(data_struc, file, indent=4)
-    
-
+import os
+from assets import ASSET_SPECS, ASSETS_INDEX_PATH, ASSETS_BLOB_PATH
+#Genera recursos.bin con las imagenes ya redimensionadas y codificadas en base64,
+#y recursos.json con el indice (offset y longitud) de cada una dentro del blob
+
+
+def encode_asset(source, size, ext):
+    """Shrink an image to fit its display box, keeping its aspect ratio.
+
+    Returns the base64-encoded image and its (width, height).
+    """
+    width, height = size
+    if source is None:
+        image = np.zeros((height, width, 3), np.uint8)
+    else:
+        image = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise FileNotFoundError(source)
+        scale = min(width / image.shape[1], height / image.shape[0])
+        if scale < 1:
+            fitted = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+            image = cv2.resize(image, fitted, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode(ext, image)
+    return base64.b64encode(buffer).decode(), (image.shape[1], image.shape[0])
+
+def build_assets():
+    index = {}
+    offset = 0
+    with open(ASSETS_BLOB_PATH + '.tmp', 'wb') as blob:
+        for name, (source, size, ext) in ASSET_SPECS.items():
+            data, (width, height) = encode_asset(source, size, ext)
+            data = data.encode('ascii')
+            blob.write(data)
+            index[name] = {"offset": offset, "length": len(data), "width": width, "height": height}
+            offset += len(data)
+
+    with open(ASSETS_INDEX_PATH + '.tmp', 'w', encoding="utf-8") as file:
+        json.dump({"version": 1, "assets": index}, file, indent=4)
+
+    os.replace(ASSETS_BLOB_PATH + '.tmp', ASSETS_BLOB_PATH)
+    os.replace(ASSETS_INDEX_PATH + '.tmp', ASSETS_INDEX_PATH)
+    print(f"Saved {len(index)} assets to {ASSETS_BLOB_PATH} ({offset} bytes)")
+
+
+if __name__ == "__main__":
+    build_assets()
@@ -0,0 +1,209 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+# Bucket granularities for RecordHistory.series
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'  # As written by detection.build_record; sorts lexicographically
+
+
+def bucket_key(timestamp, granularity):
+    """Bucket of a timestamp: 'YYYY-MM-DD', ISO week 'YYYY-Www' or 'YYYY-MM'."""
+    if granularity == DAY:
+        return timestamp[:10]
+    if granularity == MONTH:
+        return timestamp[:7]
+    if granularity == WEEK:
+        return _iso_week(timestamp[:10])
+    raise ValueError(f"Unknown granularity '{granularity}', expected {DAY}, {WEEK} or {MONTH}")
+
+@lru_cache(maxsize=4096)
+def _iso_week(day):
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def bucket_bounds(key, granularity):
+    """First timestamp of a bucket and of the one after it."""
+    if granularity == DAY:
+        start = date.fromisoformat(key)
+        end = start + timedelta(days=1)
+    elif granularity == WEEK:
+        year, week = key.split("-W")
+        start = date.fromisocalendar(int(year), int(week), 1)
+        end = start + timedelta(weeks=1)
+    elif granularity == MONTH:
+        start = date.fromisoformat(key + "-01")
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        raise ValueError(f"Unknown granularity '{granularity}', expected {DAY}, {WEEK} or {MONTH}")
+    return f"{start} 00:00:00", f"{end} 00:00:00"
+
+def days_ago(days, now=None):
+    """Timestamp `days` days before now, for range queries."""
+    return ((now or datetime.now()) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+
+class _PrefixSeries:
+    """Sorted timestamps with running totals of count and points.
+
+    The count and points of any [start, end) range are two binary searches
+    and a subtraction.
+    """
+
+    def __init__(self, timestamps=None, cumulative_points=None):
+        self.timestamps = timestamps or []
+        self.cumulative_points = cumulative_points or [0]
+
+    def add(self, timestamp, points):
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.cumulative_points.append(self.cumulative_points[-1] + points)
+            return
+        # Out of order (e.g. records merged from another kiosk): rebuild the tail
+        position = bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(position, timestamp)
+        self.cumulative_points.insert(position + 1, self.cumulative_points[position] + points)
+        for index in range(position + 2, len(self.cumulative_points)):
+            self.cumulative_points[index] += points
+
+    def range(self, start=None, end=None):
+        lo = bisect_left(self.timestamps, start) if start else 0
+        hi = bisect_left(self.timestamps, end) if end else len(self.timestamps)
+        if hi <= lo:
+            return 0, 0
+        return hi - lo, self.cumulative_points[hi] - self.cumulative_points[lo]
+
+
+class RecordHistory:
+    """Time-range queries over the record history.
+
+    Every material keeps its own timestamp-sorted prefix sums, so totals for
+    an arbitrary date range cost a few binary searches whatever the size of
+    the history. Day, week and month roll-ups are kept up to date as records
+    arrive; a bucketed series reads whole buckets from the roll-ups and only
+    the partial buckets at the edges of the range from the prefix sums.
+    Ranges are [start, end) timestamps in the records' 'YYYY-MM-DD HH:MM:SS'
+    format; None means unbounded. Safe to update and query from different
+    threads.
+    """
+
+    def __init__(self, records=()):
+        # Records are added on the page loop while range queries run on Flet handler threads
+        self._lock = threading.RLock()
+        self._all = _PrefixSeries()
+        self._materials = defaultdict(_PrefixSeries)
+        self._rollups = {granularity: {} for granularity in (DAY, WEEK, MONTH)}  # key -> [count, points]
+        self._keys = {granularity: [] for granularity in (DAY, WEEK, MONTH)}  # Sorted rollup keys
+        for record in sorted(records, key=lambda r: r['timestamp']):
+            self.add(record)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build from a record_columns.RecordColumns straight from its arrays, without record dicts."""
+        import numpy as np
+        history = cls()
+        if not len(columns):
+            return history
+        order = np.argsort(columns.column("timestamp"), kind="stable")
+        seconds = columns.column("timestamp")[order]
+        points = columns.column("points")[order].astype(np.int64)
+        labels = columns.column("label")[order]
+        timestamps = [timestamp.replace('T', ' ') for timestamp in
+                      np.datetime_as_string(seconds.astype('datetime64[s]')).tolist()]
+
+        def prefix_series(rows=None):
+            series_points = points if rows is None else points[rows]
+            series_timestamps = timestamps if rows is None else [timestamps[row] for row in rows.tolist()]
+            return _PrefixSeries(series_timestamps, [0] + np.cumsum(series_points).tolist())
+
+        history._all = prefix_series()
+        codes_by_material = defaultdict(list)
+        for code, label in enumerate(columns.names("label")):
+            codes_by_material[label or 'desconocido'].append(code)
+        for material, codes in codes_by_material.items():
+            rows = np.flatnonzero(np.isin(labels, codes))
+            if len(rows):
+                history._materials[material] = prefix_series(rows)
+        for granularity in history._rollups:
+            keys, counts = columns.count_by_period(granularity)
+            _, bucket_points = columns.sum_by_period(granularity)
+            history._keys[granularity] = keys
+            history._rollups[granularity] = {key: [count, total] for key, count, total in zip(keys, counts, bucket_points)}
+        return history
+
+    def __len__(self):
+        return len(self._all.timestamps)
+
+    def add(self, record):
+        with self._lock:
+            timestamp = record['timestamp']
+            points = record.get('points', 0)
+            self._all.add(timestamp, points)
+            self._materials[record.get('label', 'desconocido')].add(timestamp, points)
+            for granularity, rollup in self._rollups.items():
+                key = bucket_key(timestamp, granularity)
+                if key not in rollup:
+                    rollup[key] = [0, 0]
+                    keys = self._keys[granularity]
+                    if keys and key < keys[-1]:
+                        insort(keys, key)
+                    else:
+                        keys.append(key)
+                rollup[key][0] += 1
+                rollup[key][1] += points
+
+    @property
+    def first_timestamp(self):
+        with self._lock:
+            return self._all.timestamps[0] if self._all.timestamps else None
+
+    @property
+    def last_timestamp(self):
+        with self._lock:
+            return self._all.timestamps[-1] if self._all.timestamps else None
+
+    def totals(self, start=None, end=None):
+        """Return (count, points) of the records in [start, end)."""
+        with self._lock:
+            return self._all.range(start, end)
+
+    def material_totals(self, start=None, end=None):
+        """Return {material: (count, points)} for the records in [start, end), skipping empty materials."""
+        with self._lock:
+            totals = {}
+            for material, series in self._materials.items():
+                count, points = series.range(start, end)
+                if count:
+                    totals[material] = (count, points)
+            return totals
+
+    def series(self, granularity, start=None, end=None):
+        """Bucket the records in [start, end) by day, week or month.
+
+        Returns (bucket keys, points per bucket), skipping empty buckets.
+        """
+        with self._lock:
+            keys = self._keys[granularity]
+            rollup = self._rollups[granularity]
+            lo = bisect_left(keys, bucket_key(start, granularity)) if start else 0
+            hi = bisect_right(keys, bucket_key(end, granularity)) if end else len(keys)
+
+            bucket_keys, points = [], []
+            for index in range(lo, hi):
+                key = keys[index]
+                count, bucket_points = rollup[key]
+                if index == lo or index == hi - 1:
+                    # Only the edge buckets can be partly outside the range
+                    bucket_start, bucket_end = bucket_bounds(key, granularity)
+                    if (start and bucket_start < start) or (end and bucket_end > end):
+                        count, bucket_points = self._all.range(max(bucket_start, start or bucket_start),
+                                                               min(bucket_end, end or bucket_end))
+                if count:
+                    bucket_keys.append(key)
+                    points.append(bucket_points)
+            return bucket_keys, points
@@ -0,0 +1,172 @@
+import atexit
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+
+# Inference in worker processes, so the model never competes with the Flet UI
+# and JPEG encoding for the GIL. Frames travel through a shared-memory ring
+# of preallocated uint8 slots: the parent letterboxes each model input
+# straight into a free slot and only (sequence, slot, size) goes over the task
+# queue; workers send back the filtered boxes, which are a few small arrays.
+
+
+class FrameRing:
+    """Fixed number of preallocated size x size x 3 uint8 frame slots in shared memory."""
+
+    def __init__(self, slots, size, name=None):
+        self.slots = slots
+        self.size = size
+        self.owner = name is None
+        nbytes = slots * size * size * 3
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=nbytes if self.owner else 0)
+        self.frames = np.ndarray((slots, size, size, 3), dtype=np.uint8, buffer=self.memory.buf)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def view(self, slot, imgsz):
+        """Writable imgsz x imgsz view of a slot; no copy."""
+        return self.frames[slot, :imgsz, :imgsz]
+
+    def close(self):
+        self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _worker(ring_name, slots, size, tasks, results, backend, postprocess):
+    from backends import load_backend
+    import detection
+    detection.postprocess_settings.update(postprocess)
+    ring = FrameRing(slots, size, ring_name)
+    try:
+        model = load_backend(backend)
+        model(np.zeros((size, size, 3), dtype=np.uint8), imgsz=size, verbose=False)  # Warm-up
+    except Exception as e:
+        results.put(("error", str(e)))
+        ring.close()
+        return
+    results.put(("ready", None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        sequence, slot, imgsz = task
+        try:
+            result = model(ring.view(slot, imgsz), imgsz=imgsz, verbose=False)[0]
+            labels, _, confidence, xyxy = detection.filter_boxes(model, result)
+            results.put((sequence, slot, (labels, confidence, xyxy), None))
+        except Exception as e:
+            results.put((sequence, slot, None, str(e)))
+    ring.close()
+
+
+class InferencePool:
+    """Model workers fed through a FrameRing.
+
+    `acquire()` a slot, write the model input into `input_view(slot, imgsz)`,
+    then `run(slots, imgsz)` returns the filtered (labels, confidences, boxes)
+    of every slot in order and frees them, even if it raises. Runs are serialized, since the
+    callers (the service and engine inference loops) run one batch at a time.
+    """
+
+    def __init__(self, workers=1, backend=None, slots=8, slot_size=640, timeout=30.0):
+        self.workers = workers
+        self.backend = backend
+        self.slots = slots
+        self.slot_size = slot_size
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")  # Never fork a process holding torch and UI threads
+        self._ring = None
+        self._tasks = None
+        self._results = None
+        self._processes = []
+        self._free = deque(range(slots))
+        self._free_ready = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._sequence = 0
+        self._abandoned = set()  # Sequences of timed-out runs; their slots are already free again
+
+    def start(self, postprocess=None, timeout=300.0):
+        """Spawn the workers and wait until every one has loaded and warmed up the model."""
+        self._ring = FrameRing(self.slots, self.slot_size)
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        for _ in range(self.workers):
+            process = self._context.Process(
+                target=_worker, daemon=True, name="inference",
+                args=(self._ring.name, self.slots, self.slot_size, self._tasks, self._results, self.backend, postprocess or {}))
+            process.start()
+            self._processes.append(process)
+        atexit.register(self.stop)
+        for _ in range(self.workers):
+            kind, error = self._results.get(timeout=timeout)
+            if kind == "error":
+                self.stop()
+                raise RuntimeError(f"Inference worker failed to load the model: {error}")
+
+    def acquire(self, timeout=None):
+        """Take a free slot, waiting for a running batch to release one if needed."""
+        with self._free_ready:
+            if not self._free_ready.wait_for(lambda: self._free, timeout or self.timeout):
+                raise TimeoutError("No free frame slot")
+            return self._free.popleft()
+
+    def release(self, slot):
+        with self._free_ready:
+            self._free.append(slot)
+            self._free_ready.notify()
+
+    def input_view(self, slot, imgsz):
+        if imgsz > self.slot_size:
+            raise ValueError(f"Input size {imgsz} does not fit the {self.slot_size}px frame slots")
+        return self._ring.view(slot, imgsz)
+
+    def run(self, slots, imgsz):
+        """Infer the given filled slots and return their filtered boxes in order."""
+        with self._run_lock:
+            pending = {}
+            for slot in slots:
+                self._sequence += 1
+                pending[self._sequence] = slot
+                self._tasks.put((self._sequence, slot, imgsz))
+            order = list(pending)
+            outputs = {}
+            error = None
+            try:
+                while pending:
+                    sequence, slot, output, worker_error = self._results.get(timeout=self.timeout)
+                    if sequence not in pending:
+                        self._abandoned.discard(sequence)  # Late answer for a run that timed out
+                        continue
+                    del pending[sequence]
+                    self.release(slot)
+                    outputs[sequence] = output
+                    error = error or worker_error
+            except queue.Empty:
+                # The worker may have died; free the slots now so later runs do not starve
+                for sequence, slot in pending.items():
+                    self._abandoned.add(sequence)
+                    self.release(slot)
+                raise TimeoutError(f"Inference workers did not answer within {self.timeout}s")
+            if error:
+                raise RuntimeError(f"Inference worker error: {error}")
+            return [outputs[sequence] for sequence in order]
+
+    def stop(self):
+        if not self._processes:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._ring.close()
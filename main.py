@@ -1,11 +1,18 @@
+import startup
+startup.install()  # Times the imports below when ECOALDASO_STARTUP_REPORT=1
+
 from flet import app, Page
-from ui import main_page
 
 def main(page: Page):
     # Set the size of the window
 
+    # The UI module is imported here, not at startup, so the window opens before it loads
+    from ui import main_page
+    startup.mark("ui imported")
 
-    # Call your main_page function
+    # Call your main_page function; it marks the first frame once the Home tab is added
     main_page(page)
 
-app(target=main)
+# Guarded so inference worker processes (spawned, see inference_pool) do not start another app
+if __name__ == "__main__":
+    app(target=main)
@@ -3,12 +3,12 @@ import numpy as np
 import cv2
 import base64
 import time
-import json
 import matplotlib.pyplot as plt
 from ultralytics import YOLO
 from collections import defaultdict
 from datetime import datetime
 import io
+from database import load_records_from_json, insert_record_into_json
 
 def main(page: Page):
 
@@ -23,12 +23,7 @@ def main(page: Page):
         rows=[]
     )
 
-    # Función para cargar registros desde JSON
-    def load_records_from_json():
-        with open('records.json', 'r') as file:
-            return json.load(file)
-
-    # Cargar registros iniciales desde el archivo JSON
+    # Cargar registros iniciales desde el almacén de registros (ver database.py)
     object_records = load_records_from_json()
     
     # Añadir registros iniciales a la tabla
@@ -147,13 +142,6 @@ def main(page: Page):
         if cap.isOpened():
             cap.release()
 
-    def insert_record_into_json(record):
-        with open('records.json', 'r+') as file:
-            data = json.load(file)
-            data.append(record)
-            file.seek(0)
-            json.dump(data, file, indent=4)
-
     def update_record_list():
         record_list.rows.clear()
         for record in object_records:
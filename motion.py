@@ -0,0 +1,55 @@
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap frame-differencing gate that decides whether a frame is worth running YOLO on.
+
+    Frames are shrunk to a small grayscale thumbnail and compared against a
+    running-average background. When more than `min_changed_fraction` of the
+    pixels differ by over `pixel_threshold`, the scene is considered to be
+    changing and inference stays enabled for `cooldown` seconds afterwards,
+    giving the tracker time to confirm an object that was just put down.
+    """
+
+    def __init__(self, pixel_threshold=25, min_changed_fraction=0.01, cooldown=2.0, learning_rate=0.05, size=(64, 64)):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.cooldown = cooldown
+        self.learning_rate = learning_rate
+        self.size = size
+        self.background = None
+        self.active_until = 0.0
+        self.gated_frames = 0
+        self.inferred_frames = 0
+
+    def reset(self):
+        self.background = None
+        self.active_until = 0.0
+
+    def check(self, frame):
+        """Return True if the frame should go through inference."""
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+
+        if self.background is None:
+            self.background = small
+            motion = True
+        else:
+            diff = cv2.absdiff(small, self.background)
+            changed = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+            cv2.accumulateWeighted(small, self.background, self.learning_rate)
+            motion = changed >= self.min_changed_fraction
+
+        now = time.monotonic()
+        if motion:
+            self.active_until = now + self.cooldown
+        if now < self.active_until:
+            self.inferred_frames += 1
+            return True
+        self.gated_frames += 1
+        return False
+
+    def stats(self):
+        return {"gated_frames": self.gated_frames, "inferred_frames": self.inferred_frames}
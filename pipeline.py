@@ -0,0 +1,38 @@
+import queue
+import time
+
+
+def put_latest(frame_queue, item):
+    """Put an item in a bounded queue, dropping the oldest entries if it is full.
+
+    Returns the number of entries that were dropped to make room.
+    """
+    dropped = 0
+    while True:
+        try:
+            frame_queue.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                frame_queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class RateMeter:
+    """Smoothed events-per-second meter."""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.count = 0
+        self.fps = 0.0
+        self._last = None
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._last is not None and now > self._last:
+            instant = 1.0 / (now - self._last)
+            self.fps = instant if self.count == 1 else self.fps + self.alpha * (instant - self.fps)
+        self._last = now
+        self.count += 1
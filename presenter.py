@@ -0,0 +1,167 @@
+import base64
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+import metrics
+
+
+def letterbox(image, width, height, out=None):
+    """Fit an image into width x height keeping its aspect ratio, padding with black.
+
+    Writes into `out` when given (e.g. a shared-memory frame slot).
+    Returns the padded image, the scale applied and the (x, y) padding.
+    """
+    h, w = image.shape[:2]
+    scale = min(width / w, height / h)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    pad_x, pad_y = (width - new_w) // 2, (height - new_h) // 2
+    if out is None:
+        padded = np.zeros((height, width, 3), dtype=np.uint8)
+    else:
+        padded = out
+        padded.fill(0)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    padded[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    return padded, scale, (pad_x, pad_y)
+
+
+class MjpegServer:
+    """Local HTTP endpoint streaming the latest JPEG as multipart/x-mixed-replace.
+
+    Lets the Image control point at a URL instead of receiving every frame
+    as a base64 string through the Flet websocket.
+    """
+
+    def __init__(self, port=8554, host='127.0.0.1'):
+        self.host = host
+        self.port = port
+        self._jpeg = None
+        self._condition = threading.Condition()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/stream.mjpg"
+
+    def start(self):
+        if self._server is not None:
+            return
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/stream.mjpg':
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                last = None
+                try:
+                    while True:
+                        with server._condition:
+                            server._condition.wait_for(lambda: server._jpeg is not last, timeout=5)
+                            jpeg = last = server._jpeg
+                        if jpeg is None:
+                            continue
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n')
+                        self.wfile.write(f'Content-Length: {len(jpeg)}\r\n\r\n'.encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b'\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def publish(self, jpeg):
+        with self._condition:
+            self._jpeg = jpeg
+            self._condition.notify_all()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+class FramePresenter:
+    """Pushes frames to a Flet Image control as cheaply as possible.
+
+    Frames are letterboxed into a preallocated buffer, so raw camera frames
+    (preview) keep the same proportions as the detection loop's frames,
+    then encoded at a configurable JPEG quality and throttled to `max_fps`.
+    Showing the same frame object again (e.g. the frozen frame) does not
+    re-encode it. With an MjpegServer the control is pointed at the stream
+    URL once and frames skip base64.
+    """
+
+    def __init__(self, image_control, width=420, height=420, jpeg_quality=80, max_fps=15, mjpeg_server=None):
+        self.image_control = image_control
+        self.width = width
+        self.height = height
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.mjpeg_server = mjpeg_server
+        self._buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self._last_image = None
+        self._last_time = 0.0
+        self.presented_frames = 0
+        self.skipped_frames = 0
+
+    def show(self, image, force=False):
+        """Display a frame; returns False if it was skipped as unchanged or over the FPS cap."""
+        now = time.monotonic()
+        if not force and (image is self._last_image or now - self._last_time < self.min_interval):
+            self.skipped_frames += 1
+            metrics.inc("skipped_display_frames")
+            return False
+
+        if image.shape[1] != self.width or image.shape[0] != self.height:
+            frame = letterbox(image, self.width, self.height, self._buffer)[0]
+        else:
+            frame = image
+        with metrics.timer("encode"):
+            _, buffer = cv2.imencode('.jpg', frame, self.encode_params)
+
+        with metrics.timer("display_update"):
+            if self.mjpeg_server is not None:
+                self.mjpeg_server.publish(buffer.tobytes())
+                if self.image_control.src != self.mjpeg_server.url:
+                    self.image_control.src_base64 = None
+                    self.image_control.src = self.mjpeg_server.url
+                    self.image_control.update()
+            else:
+                self.image_control.src_base64 = base64.b64encode(buffer).decode()
+                self.image_control.update()
+
+        self._last_image = image
+        self._last_time = now
+        self.presented_frames += 1
+        return True
+
+
+_presenters = {}  # id(image_control) -> presenter
+_mjpeg_server = None
+
+def get_presenter(image_control, width=420, height=420, jpeg_quality=80, max_fps=15, mjpeg_port=None):
+    """Return the presenter for an Image control, creating it on first use."""
+    global _mjpeg_server
+    presenter = _presenters.get(id(image_control))
+    if presenter is None or presenter.image_control is not image_control or (presenter.width, presenter.height) != (width, height):
+        server = None
+        if mjpeg_port is not None:
+            if _mjpeg_server is None:
+                _mjpeg_server = MjpegServer(mjpeg_port)
+                _mjpeg_server.start()
+            server = _mjpeg_server
+        presenter = FramePresenter(image_control, width, height, jpeg_quality, max_fps, server)
+        _presenters[id(image_control)] = presenter
+    return presenter
@@ -0,0 +1,188 @@
+from datetime import date
+import numpy as np
+from history import DAY, MONTH, WEEK
+
+
+class RecordColumns:
+    """Detection records stored column by column in NumPy arrays.
+
+    Repeated strings are interned to integer codes (int16 for the few labels
+    and containers, int32 for users and kiosks, which can be many), timestamps are int64 seconds of the local wall-clock time they
+    were written with (so day/month arithmetic needs no time zone), confidence
+    is float32 and points int16. Arrays grow by doubling, so appending is
+    amortized O(1), and records are only turned back into dicts when read,
+    e.g. for the visible page of the Records table. Record ids are not kept;
+    the record store has the full records.
+    """
+
+    STRING_COLUMNS = {"label": np.int16, "container": np.int16, "user": np.int32, "kiosk": np.int32}  # Code dtypes
+    NUMERIC_COLUMNS = {"timestamp": np.int64, "confidence": np.float32, "points": np.int16}
+
+    def __init__(self, capacity=1024, names=None):
+        self._size = 0
+        # Intern tables, shared with slices so their codes stay comparable
+        self._names = names or {column: [] for column in self.STRING_COLUMNS}
+        self._codes = {column: {name: code for code, name in enumerate(self._names[column])} for column in self.STRING_COLUMNS}
+        self._arrays = {column: np.empty(capacity, dtype=dtype) for column, dtype in self.STRING_COLUMNS.items()}
+        self._arrays.update({column: np.empty(capacity, dtype=dtype) for column, dtype in self.NUMERIC_COLUMNS.items()})
+
+    @classmethod
+    def from_records(cls, records, chunk_size=8192):
+        """Build from any iterable of records, e.g. a record store's reader.
+
+        Records are converted in chunks, so only `chunk_size` of them are held
+        as dicts at a time.
+        """
+        columns = cls()
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                columns.extend(chunk)
+                chunk = []
+        columns.extend(chunk)
+        return columns
+
+    def extend(self, records):
+        """Append a list of records, converting each column in one pass."""
+        start, end = self._size, self._size + len(records)
+        self._reserve(end)
+        for column in self.STRING_COLUMNS:
+            intern = self._intern
+            self._arrays[column][start:end] = [intern(column, record.get(column)) for record in records]
+        # NumPy parses 'YYYY-MM-DD HH:MM:SS' itself, far faster than strptime per record
+        timestamps = np.array([record['timestamp'] for record in records], dtype='datetime64[s]')
+        self._arrays["timestamp"][start:end] = timestamps.astype(np.int64)
+        self._arrays["confidence"][start:end] = [record.get('confidence', 0.0) for record in records]
+        self._arrays["points"][start:end] = [record.get('points', 0) for record in records]
+        self._size = end
+
+    def _reserve(self, size):
+        capacity = len(self._arrays["timestamp"])
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for column, array in self._arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._arrays[column] = grown
+
+    def _intern(self, column, name):
+        code = self._codes[column].get(name)
+        if code is None:
+            code = self._codes[column][name] = len(self._names[column])
+            self._names[column].append(name)
+        return code
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """Bytes held by the column arrays, including spare capacity."""
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def column(self, name):
+        """View of a column: codes for string columns (see names()), values otherwise."""
+        return self._arrays[name][:self._size]
+
+    def names(self, column):
+        """Strings of an interned column, indexed by code."""
+        return self._names[column]
+
+    def append(self, record):
+        self._reserve(self._size + 1)
+        row = self._size
+        for column in self.STRING_COLUMNS:
+            self._arrays[column][row] = self._intern(column, record.get(column))
+        self._arrays["timestamp"][row] = np.datetime64(record['timestamp'], 's').astype(np.int64)
+        self._arrays["confidence"][row] = record.get('confidence', 0.0)
+        self._arrays["points"][row] = record.get('points', 0)
+        self._size += 1
+
+    def record(self, row):
+        """Materialize one row as a record dict; missing string fields are left out."""
+        record = {
+            "label": self._names["label"][self._arrays["label"][row]],
+            "confidence": float(self._arrays["confidence"][row]),
+            "points": int(self._arrays["points"][row]),
+            "container": self._names["container"][self._arrays["container"][row]],
+            "timestamp": str(np.datetime64(int(self._arrays["timestamp"][row]), 's')).replace('T', ' '),
+            "user": self._names["user"][self._arrays["user"][row]],
+            "kiosk": self._names["kiosk"][self._arrays["kiosk"][row]],
+        }
+        return {field: value for field, value in record.items() if value is not None}
+
+    def __iter__(self):
+        return (self.record(row) for row in range(self._size))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.take(np.arange(self._size)[key])
+        if key < 0:
+            key += self._size
+        if not 0 <= key < self._size:
+            raise IndexError(key)
+        return self.record(key)
+
+    def take(self, rows):
+        """New container with the given rows, sharing this one's intern tables."""
+        rows = np.asarray(rows, dtype=np.intp)
+        taken = RecordColumns(capacity=max(1, len(rows)), names=self._names)
+        taken._codes = self._codes
+        for column, array in self._arrays.items():
+            taken._arrays[column][:len(rows)] = array[:self._size][rows]
+        taken._size = len(rows)
+        return taken
+
+    def sum_by(self, column, values="points"):
+        """Total of a numeric column per value of a string column, e.g. points per label."""
+        totals = self._as_values(np.bincount(self.column(column), weights=self.column(values),
+                                             minlength=len(self._names[column])), values)
+        return {name: totals[code].item() for code, name in enumerate(self._names[column]) if totals[code]}
+
+    def _as_values(self, totals, values):
+        # bincount sums weights as float64; integer columns get integer totals back
+        return totals.astype(np.int64) if np.issubdtype(self._arrays[values].dtype, np.integer) else totals
+
+    def count_by(self, column):
+        counts = np.bincount(self.column(column), minlength=len(self._names[column]))
+        return {name: int(counts[code]) for code, name in enumerate(self._names[column]) if counts[code]}
+
+    def sum_by_period(self, granularity, values="points"):
+        """Total of a numeric column per day, ISO week or month, keyed like history.bucket_key.
+
+        Returns (bucket keys, totals) in chronological order, skipping empty buckets.
+        """
+        labels, inverse = self._periods(granularity)
+        totals = self._as_values(np.bincount(inverse, weights=self.column(values), minlength=len(labels)), values)
+        return labels, totals.tolist()
+
+    def count_by_period(self, granularity):
+        """Number of records per day, ISO week or month; see sum_by_period."""
+        labels, inverse = self._periods(granularity)
+        return labels, np.bincount(inverse, minlength=len(labels)).tolist()
+
+    def _periods(self, granularity):
+        """Bucket keys in chronological order and the bucket of every row."""
+        days = self.column("timestamp") // 86400
+        if granularity == DAY:
+            buckets = days
+        elif granularity == WEEK:
+            buckets = days - (days + 3) % 7  # Monday of the week; 1970-01-01 was a Thursday
+        elif granularity == MONTH:
+            buckets = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        else:
+            raise ValueError(f"Unknown granularity '{granularity}', expected {DAY}, {WEEK} or {MONTH}")
+        keys, inverse = np.unique(buckets, return_inverse=True)
+        if granularity == MONTH:
+            labels = [str(month) for month in keys.astype('datetime64[M]')]
+        elif granularity == WEEK:
+            labels = []
+            for monday in keys.astype('datetime64[D]').astype(date):
+                year, week, _ = monday.isocalendar()
+                labels.append(f"{year}-W{week:02d}")
+        else:
+            labels = [str(day) for day in keys.astype('datetime64[D]')]
+        return labels, inverse
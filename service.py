@@ -0,0 +1,178 @@
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import metrics
+from detection import DetectionState, build_record, process_gated_frame, wait_for_model
+from database import insert_record_into_json
+from pipeline import RateMeter
+
+# Event kinds
+FRAME = "frame"  # Camera frame with no inference result (preview, or static scene)
+DETECTIONS = "detections"  # Annotated frame with its (label, confidence, box) detections
+CONFIRMED = "confirmed"  # An object was confirmed and its record saved
+ERROR = "error"
+
+DetectionEvent = namedtuple("DetectionEvent", ["kind", "frame", "detections", "record", "error"], defaults=(None, None, None, None))
+
+
+class DetectionService:
+    """Asyncio front end to the camera and the model, shared by every page.
+
+    Subscribers iterate `events()`; the first one starts a producer task and
+    the last one to leave stops it and releases the camera. Blocking calls
+    (opening the camera, cap.read, inference, saving records) run on a small
+    fixed executor, so any number of subscribers costs no extra threads.
+    Each subscriber has its own small queue that drops its oldest event when
+    it falls behind, so a slow page never stalls the camera.
+    """
+
+    def __init__(self, camera_index=0, width=420, height=420, max_workers=2, queue_size=2):
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detection")
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.dropped_frames = 0  # Captured frames replaced by a newer one before inference took them
+        self.dropped_events = 0
+        self._subscribers = {}  # queue -> wants inference
+        self._task = None
+        self._latest = None
+        self._frame_ready = None
+
+    def stats(self):
+        return {
+            "capture_fps": round(self.capture_rate.fps, 1),
+            "inference_fps": round(self.inference_rate.fps, 1),
+            "captured_frames": self.capture_rate.count,
+            "inferred_frames": self.inference_rate.count,
+            "dropped_frames": self.dropped_frames,
+            "dropped_events": self.dropped_events,
+            "subscribers": len(self._subscribers),
+        }
+
+    async def wait_for_model(self, timeout=None):
+        # Not on self.executor: a wait can last the whole model load, and parking one of its few
+        # workers would stall every page's capture and inference
+        return await asyncio.to_thread(wait_for_model, timeout)
+
+    async def events(self, infer=True):
+        """Async iterator of DetectionEvents; with infer=False only raw FRAME events are sent."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[queue] = infer
+        self._ensure_running()
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event.kind == ERROR:
+                    return
+        finally:
+            del self._subscribers[queue]
+
+    def _publish(self, event, infer_only=False):
+        for queue, infer in list(self._subscribers.items()):
+            if infer or not infer_only:
+                self._publish_to(queue, event)
+
+    def _publish_to(self, queue, event):
+        while queue.full():
+            queue.get_nowait()
+            self.dropped_events += 1
+            metrics.inc("dropped_events")
+        queue.put_nowait(event)
+
+    def _ensure_running(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            await self._produce()
+        finally:
+            self._task = None
+            if self._subscribers:  # Someone subscribed while the producer was shutting down
+                self._ensure_running()
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        cap = await loop.run_in_executor(self.executor, cv2.VideoCapture, self.camera_index)
+        if not cap.isOpened():
+            print("Error: Could not open webcam")
+            self._publish(DetectionEvent(ERROR, error="Could not open webcam"))
+            return
+
+        self._latest = None
+        self._frame_ready = asyncio.Event()
+        capture = loop.create_task(self._capture_loop(cap))
+        try:
+            await self._inference_loop(capture)
+        finally:
+            capture.cancel()
+            await asyncio.gather(capture, return_exceptions=True)
+            await loop.run_in_executor(self.executor, cap.release)
+
+    async def _capture_loop(self, cap):
+        loop = asyncio.get_running_loop()
+        while self._subscribers:
+            with metrics.timer("capture"):
+                ret, frame = await loop.run_in_executor(self.executor, cap.read)
+            if not ret:
+                print("Error: Failed to capture image")
+                self._publish(DetectionEvent(ERROR, error="Failed to capture image"))
+                break
+            self.capture_rate.tick()
+            metrics.inc("captured_frames")
+            if self._latest is not None:
+                self.dropped_frames += 1
+                metrics.inc("dropped_frames")
+            self._latest = frame
+            self._frame_ready.set()
+            for queue, infer in list(self._subscribers.items()):
+                if not infer:
+                    self._publish_to(queue, DetectionEvent(FRAME, frame))
+        self._frame_ready.set()
+
+    async def _inference_loop(self, capture):
+        loop = asyncio.get_running_loop()
+        state = DetectionState()
+        while self._subscribers and not capture.done():
+            await self._frame_ready.wait()
+            self._frame_ready.clear()
+            frame, self._latest = self._latest, None
+            if not any(self._subscribers.values()):
+                state.reset()  # Preview only; the next detection subscriber starts from scratch
+                continue
+            if frame is None:
+                continue
+
+            with metrics.timer("detect"):
+                frame, detections = await loop.run_in_executor(
+                    self.executor, process_gated_frame, frame, state.motion_gate, self.width, self.height,
+                    state.input_size())
+            if detections is None:
+                self._publish(DetectionEvent(FRAME, frame), infer_only=True)
+                continue
+            self.inference_rate.tick()
+
+            confirmed = state.update(frame, detections)
+            if confirmed is None:
+                self._publish(DetectionEvent(DETECTIONS, frame, detections), infer_only=True)
+                continue
+            record = build_record(*confirmed)
+            metrics.inc("confirmed_objects")
+            await loop.run_in_executor(self.executor, insert_record_into_json, record)
+            self._publish(DetectionEvent(CONFIRMED, state.last_frame, detections, record), infer_only=True)
+            state.reset()
+
+
+_service = None
+
+def get_detection_service():
+    """Return the detection service shared by every page of the app."""
+    global _service
+    if _service is None:
+        _service = DetectionService()
+    return _service
@@ -0,0 +1,150 @@
+import asyncio
+from contextlib import aclosing
+import metrics
+from detection import clear_display, instructions_mapping, model_load_finished, set_image_control
+from service import CONFIRMED, DETECTIONS, ERROR, get_detection_service
+
+# Session states
+IDLE = "idle"
+PREVIEWING = "previewing"
+DETECTING = "detecting"
+FROZEN = "frozen"
+
+
+class DetectionSession:
+    """Camera preview and detection for one set of Detector tab controls.
+
+    The session is a state machine (idle, previewing, detecting, frozen)
+    running on the page's asyncio loop. Previewing and detecting are tasks
+    consuming events from the shared DetectionService; idle and frozen have
+    no task at all, so the camera is released and they cost no CPU.
+    Transitions run one at a time under a lock, in the order they were
+    requested, and a new state only starts once the previous task has
+    finished. A state task that ends on its own (error, confirmed object)
+    only moves on if no newer request is pending.
+    """
+
+    def __init__(self, image_control, detection_text, instruction_label, record_pager, page,
+                 width=420, height=420, service=None, record_history=None):
+        self.image_control = image_control
+        self.detection_text = detection_text
+        self.instruction_label = instruction_label
+        self.record_pager = record_pager
+        self.record_history = record_history
+        self.page = page
+        self.width = width
+        self.height = height
+        self.service = service or get_detection_service()
+        self.state = IDLE
+        self._requested = IDLE  # Latest requested state; differs from state while a transition is pending
+        self._transition_lock = asyncio.Lock()
+        self._task = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call `callback(state)` on every state transition."""
+        self._listeners.append(callback)
+
+    # Safe to call from Flet event handlers; the transition runs on the page loop
+    def start_preview(self):
+        self.page.run_task(self.transition, PREVIEWING)
+
+    def start_detection(self):
+        self.page.run_task(self.transition, DETECTING)
+
+    def stop(self):
+        self.page.run_task(self.transition, IDLE)
+
+    async def transition(self, new_state):
+        # Recorded before any await, so repeated and superseded requests are judged against the latest one
+        if new_state == self._requested and new_state in (PREVIEWING, DETECTING):
+            return
+        self._requested = new_state
+        async with self._transition_lock:
+            if self._requested != new_state:
+                return  # A newer request is waiting for the lock
+            task, self._task = self._task, None
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+            self._set_state(new_state)
+            if new_state == PREVIEWING:
+                self._task = asyncio.create_task(self._run_preview())
+            elif new_state == DETECTING:
+                self._task = asyncio.create_task(self._run_detection())
+            elif new_state == IDLE:
+                clear_display(self.image_control)
+
+    async def _finish(self, next_state):
+        """Called by the running state task when it ends on its own."""
+        if self._task is not asyncio.current_task() or self._requested != self.state:
+            return  # Being replaced by a newer request
+        await self.transition(next_state)
+
+    def _update_page(self):
+        with metrics.timer("page_update"):
+            self.page.update()
+
+    def _set_state(self, state):
+        self.state = state
+        for listener in list(self._listeners):
+            try:
+                listener(state)
+            except Exception as e:
+                print(f"Error notifying session state: {e}")
+
+    async def _run_preview(self):
+        clear_display(self.image_control)
+        async with aclosing(self.service.events(infer=False)) as events:
+            async for event in events:
+                if event.kind == ERROR:
+                    break
+                set_image_control(self.image_control, event.frame, self.width, self.height)
+        await self._finish(IDLE)
+
+    async def _run_detection(self):
+        clear_display(self.image_control)
+        self.detection_text.value = ""
+        self.instruction_label.value = "Instrucciónes: None"
+        self._update_page()
+
+        if not await self.service.wait_for_model(0):
+            # After a failed load the wait below returns at once, so only show the message while loading
+            if not model_load_finished():
+                self.detection_text.value = "Cargando modelo..."
+                self._update_page()
+            if not await self.service.wait_for_model():
+                self.detection_text.value = "Error: no se pudo cargar el modelo"
+                self._update_page()
+                await self._finish(IDLE)
+                return
+            self.detection_text.value = ""
+
+        next_state = IDLE
+        async with aclosing(self.service.events(infer=True)) as events:
+            async for event in events:
+                if event.kind == ERROR:
+                    break
+                if event.kind == CONFIRMED:
+                    self._on_confirmed(event.frame, event.record)
+                    next_state = FROZEN
+                    break
+                if event.kind == DETECTIONS and event.detections:
+                    self.detection_text.value = "Parece que es: " + ", ".join(label for label, _, _ in event.detections)
+                    self._update_page()
+                set_image_control(self.image_control, event.frame, self.width, self.height)
+        # Leaving the iterator unsubscribes; the service releases the camera once nobody listens
+        await self._finish(next_state)
+
+    def _on_confirmed(self, frame, record):
+        detected_label = record["label"]
+        instruction = instructions_mapping.get(detected_label, "Instrucción no disponible.")
+        self.detection_text.value = f"Objeto detectado: {detected_label} ({record['confidence']:.2f})"
+        self.instruction_label.value = f"Instrucciónes: {instruction}"
+        set_image_control(self.image_control, frame, self.width, self.height, force=True)
+        # The service has already saved the record; only the in-memory views are updated here
+        self.record_pager.add(record)
+        if self.record_history is not None:
+            self.record_history.add(record)
+        self._update_page()
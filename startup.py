@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Startup timing. With ECOALDASO_STARTUP_REPORT=1, main.py prints an
+# -X importtime style table of every module imported before the first frame
+# (self and cumulative time, indented by nesting) plus the time to the first
+# frame of the Home tab. `python startup.py check` (and test_startup.py) is
+# the regression check: it builds the app on a HeadlessPage in a fresh
+# interpreter and fails if the first frame is over budget or heavy modules
+# were imported before it.
+
+_start = time.perf_counter()
+enabled = os.environ.get("ECOALDASO_STARTUP_REPORT") == "1"
+FIRST_FRAME_BUDGET = float(os.environ.get("ECOALDASO_FIRST_FRAME_BUDGET", "2.0"))  # Seconds
+# Must not be imported before the first frame of the Home tab
+HEAVY_MODULES = ("torch", "ultralytics", "matplotlib", "cv2", "numpy")
+
+_imports = []  # (depth, module, self seconds, cumulative seconds), in completion order
+_marks = []  # (phase, seconds since start)
+heavy_at_first_frame = []  # HEAVY_MODULES already imported when the first frame was shown
+_local = threading.local()
+
+
+class _TimedLoader:
+    """Wraps a module loader to time exec_module, like -X importtime."""
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = _local.__dict__.setdefault("stack", [])
+        stack.append(0.0)  # Time spent in nested imports
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _imports.append((len(stack), module.__name__, elapsed - nested, elapsed))
+
+
+class _ImportTimer:
+    """Meta path finder that defers to the others and times the loaders they return."""
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader)
+            return spec
+        return None
+
+
+def install():
+    """Start recording imports if the startup report is enabled; call before other imports."""
+    if enabled and not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+def mark(phase):
+    _marks.append((phase, time.perf_counter() - _start))
+
+def first_frame():
+    """Record that the Home tab is on screen and print the report if enabled.
+
+    Called right after page.add, before any background work starts, so the
+    heavy modules seen here are the ones the first frame waited for.
+    """
+    global heavy_at_first_frame
+    mark("first frame")
+    heavy_at_first_frame = sorted(name for name in HEAVY_MODULES if name in sys.modules)
+    if enabled:
+        report()
+
+def first_frame_time():
+    """Seconds from startup to the first frame, or None if it has not been shown."""
+    return next((seconds for phase, seconds in reversed(_marks) if phase == "first frame"), None)
+
+def report(min_cumulative=0.001):
+    print("import time: self [us] | cumulative | imported package")
+    for depth, module, self_time, cumulative in _imports:
+        if cumulative >= min_cumulative:
+            print(f"import time: {self_time * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{module}")
+    for phase, seconds in _marks:
+        print(f"startup: {phase} at {seconds:.3f}s")
+    if heavy_at_first_frame:
+        print(f"startup: heavy modules loaded before the first frame: {', '.join(heavy_at_first_frame)}")
+    seconds = first_frame_time()
+    if seconds is not None and seconds > FIRST_FRAME_BUDGET:
+        print(f"startup: first frame took {seconds:.3f}s, over the {FIRST_FRAME_BUDGET:.1f}s budget")
+
+
+_RESULT_PREFIX = "first frame result: "
+
+
+class HeadlessPage:
+    """Stand-in for flet.Page that keeps the added controls, to build the app without a window."""
+
+    def __init__(self):
+        self.controls = []
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+
+    def update(self, *controls):
+        pass
+
+    def run_task(self, handler, *args):
+        pass
+
+def time_first_frame():
+    """Build the app on a HeadlessPage and print the first-frame time and early heavy modules as JSON."""
+    import main
+    main.main(HeadlessPage())
+    print(_RESULT_PREFIX + json.dumps({"first_frame": first_frame_time(), "heavy": heavy_at_first_frame}), flush=True)
+
+def measure(cwd=None):
+    """Time the first frame in a fresh interpreter; return (seconds, heavy modules loaded before it).
+
+    Runs in `cwd` when given, e.g. a scratch directory with a copy of imagenes/,
+    so the records and caches the app creates do not touch the real ones.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [directory, os.environ.get("PYTHONPATH")])))
+    env.pop("ECOALDASO_STARTUP_REPORT", None)
+    output = subprocess.run([sys.executable, "-c", "import startup; startup.time_first_frame()"],
+                            cwd=cwd or directory, env=env, capture_output=True, text=True, check=True).stdout
+    # Background work started by the app may print around, or on the same line as, the result
+    line = next(line for line in output.splitlines() if _RESULT_PREFIX in line)
+    result = json.loads(line.split(_RESULT_PREFIX, 1)[1])
+    return result["first_frame"], result["heavy"]
+
+def check(budget=FIRST_FRAME_BUDGET, runs=3):
+    """Return True if the Home tab's first frame stays under `budget` seconds and waits for no heavy module."""
+    results = [measure() for _ in range(runs)]
+    seconds = min(result[0] for result in results)  # Best of several runs, to discount a cold disk cache
+    heavy = results[-1][1]
+    print(f"Home tab first frame: {seconds:.3f}s (budget {budget:.1f}s, best of {runs})")
+    if heavy:
+        print(f"Heavy modules imported before the first frame: {', '.join(heavy)}")
+    return seconds <= budget and not heavy
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup time tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    check_parser = subparsers.add_parser("check", help="Fail if the Home tab's startup path is over budget")
+    check_parser.add_argument("--budget", type=float, default=FIRST_FRAME_BUDGET, help="Seconds")
+    check_parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    if args.command == "check":
+        sys.exit(0 if check(args.budget, args.runs) else 1)
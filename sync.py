@@ -0,0 +1,308 @@
+import argparse
+import atexit
+import gzip
+import http.client
+import json
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import metrics
+
+# Offline-first upload of kiosk records to a central store. New records are
+# appended to a local queue file and shipped in gzip'd JSON batches by a
+# background thread, so saving a detection never waits on the network.
+# Records carry an "id" (see detection.build_record) and the central store
+# ignores ids it already has, so a batch resent after a lost response is harmless.
+#
+# Enable with ECOALDASO_SYNC_URL, e.g. against the local stand-in server:
+#   python sync.py serve --port 8600 --output central.jsonl
+#   ECOALDASO_SYNC_URL=http://127.0.0.1:8600/records python main.py
+
+SYNC_QUEUE_PATH = 'sync_queue.jsonl'
+SYNC_OFFSET_PATH = 'sync_queue.offset'  # Bytes of the queue file acknowledged by the central store
+
+sync_settings = {
+    "endpoint": os.environ.get("ECOALDASO_SYNC_URL"),
+    "batch_size": 100,  # Records per request
+    "flush_interval": 5.0,  # Seconds a partial batch waits for more records
+    "initial_backoff": 1.0,
+    "max_backoff": 300.0,
+    "timeout": 10.0,
+    "compact_bytes": 1 << 20,  # Truncate the queue file once this much of it is acknowledged
+}
+
+
+class SyncError(Exception):
+    pass
+
+
+class SyncQueue:
+    """Durable outbound queue of records, drained by a sender thread.
+
+    The queue is an append-only JSON Lines file plus the offset of the last
+    acknowledged byte, so records survive restarts and only the
+    unacknowledged tail is resent. One HTTP connection is kept open between
+    batches; after a failure the sender backs off exponentially with jitter.
+    """
+
+    def __init__(self, endpoint, path=SYNC_QUEUE_PATH, offset_path=SYNC_OFFSET_PATH, batch_size=100,
+                 flush_interval=5.0, initial_backoff=1.0, max_backoff=300.0, timeout=10.0, compact_bytes=1 << 20):
+        url = urlsplit(endpoint)
+        if url.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported sync endpoint '{endpoint}'")
+        self.endpoint = endpoint
+        self._https = url.scheme == 'https'
+        self._host = url.netloc
+        self._path = (url.path or '/') + (f"?{url.query}" if url.query else '')
+        self.path = path
+        self.offset_path = offset_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.compact_bytes = compact_bytes
+        self.sent_records = 0
+        self.failures = 0
+        self._connection = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = self._open()
+        self._offset = self._load_offset()
+        self._pending = self._count_pending()
+
+    def _open(self):
+        from database import open_for_append  # database imports this module
+        return open_for_append(self.path, binary=True)
+
+    def _load_offset(self):
+        try:
+            with open(self.offset_path, 'r', encoding="utf-8") as file:
+                offset = int(file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            offset = 0
+        # Larger than the file: the queue was compacted before the offset was reset
+        return offset if offset <= os.path.getsize(self.path) else 0
+
+    def _save_offset(self, offset):
+        tmp_path = self.offset_path + '.tmp'
+        with open(tmp_path, 'w', encoding="utf-8") as file:
+            file.write(str(offset))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def _count_pending(self):
+        with open(self.path, 'rb') as file:
+            file.seek(self._offset)
+            return sum(1 for line in file if line.strip())
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def stats(self):
+        return {"pending_records": self._pending, "sent_records": self.sent_records, "failures": self.failures}
+
+    def enqueue(self, record):
+        """Queue a record for upload; returns once it is on local disk."""
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode()
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sync", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._close_connection()
+        with self._lock:
+            self._file.close()
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            records, lines, end_offset = self._read_batch()
+            if len(records) < self.batch_size:
+                # Partial batch: wait for more records, up to flush_interval
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                records, lines, end_offset = self._read_batch()
+            if not records:
+                if end_offset != self._offset:
+                    self._ack(0, lines, end_offset)  # Only blank or corrupt lines
+                continue
+            try:
+                self._send(records)
+            except (OSError, http.client.HTTPException, SyncError) as e:
+                failures += 1
+                self.failures += 1
+                metrics.inc("sync_failures")
+                self._close_connection()
+                delay = min(self.max_backoff, self.initial_backoff * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+                print(f"Error syncing {len(records)} records (retrying in {delay:.1f}s): {e}")
+                self._stop.wait(delay)
+                continue
+            failures = 0
+            self._ack(len(records), lines, end_offset)
+
+    def _read_batch(self):
+        """Read up to batch_size whole records after the acknowledged offset.
+
+        Returns the records, the number of non-blank lines read and the offset after them.
+        """
+        records = []
+        lines = 0
+        with open(self.path, 'rb') as file:
+            file.seek(self._offset)
+            end_offset = self._offset
+            while len(records) < self.batch_size:
+                line = file.readline()
+                if not line.endswith(b'\n'):
+                    break  # End of file, or a line still being written
+                end_offset += len(line)
+                if not line.strip():
+                    continue
+                lines += 1
+                try:
+                    records.append(json.loads(line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    print(f"Skipping corrupt line in {self.path}")
+        return records, lines, end_offset
+
+    def _send(self, records):
+        body = gzip.compress(json.dumps(records, ensure_ascii=False).encode())
+        if self._connection is None:
+            connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            self._connection = connection_class(self._host, timeout=self.timeout)
+        with metrics.timer("sync_request"):
+            self._connection.request('POST', self._path, body, {
+                'Content-Type': 'application/json',
+                'Content-Encoding': 'gzip',
+            })
+            response = self._connection.getresponse()
+            response.read()  # Drain the body so the connection can be reused
+        if response.will_close:
+            self._close_connection()
+        if not 200 <= response.status < 300:
+            raise SyncError(f"{self.endpoint} answered {response.status} {response.reason}")
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _ack(self, count, lines, end_offset):
+        with self._lock:
+            self._offset = end_offset
+            self._pending = max(0, self._pending - lines)
+            if self._offset >= self.compact_bytes and self._offset == os.fstat(self._file.fileno()).st_size:
+                # Everything is acknowledged: start the queue file over
+                self._file.truncate(0)
+                self._offset = 0
+            self._save_offset(self._offset)
+        self.sent_records += count
+        metrics.inc("synced_records", count)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_sync_queue():
+    """Return the running sync queue, or None if no endpoint is configured."""
+    global _queue
+    with _queue_lock:
+        if _queue is None and sync_settings["endpoint"]:
+            settings = {name: value for name, value in sync_settings.items() if name != "endpoint"}
+            _queue = SyncQueue(sync_settings["endpoint"], **settings)
+            _queue.start()
+            atexit.register(_queue.stop)
+        return _queue
+
+
+def serve(port=8600, output='central_records.jsonl', host='127.0.0.1'):
+    """Stand-in central store: accepts gzip'd JSON batches and appends records with unseen ids."""
+    seen = set()
+    try:
+        with open(output, 'r', encoding="utf-8") as file:
+            for line in file:
+                try:
+                    seen.add(json.loads(line).get("id"))
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        pass
+    lock = threading.Lock()
+    store = open(output, 'a', encoding="utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, so kiosks can reuse their connection
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                records = json.loads(body)
+            except (OSError, ValueError):
+                self._reply(400, {"error": "invalid batch"})
+                return
+            accepted = 0
+            with lock:
+                for record in records:
+                    if record.get("id") in seen:
+                        continue
+                    seen.add(record.get("id"))
+                    store.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    accepted += 1
+                store.flush()
+            self._reply(200, {"accepted": accepted, "duplicates": len(records) - accepted})
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Central store listening on http://{host}:{port}/records, writing to {output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kiosk record sync tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Run a local stand-in for the central record store")
+    serve_parser.add_argument("--port", type=int, default=8600)
+    serve_parser.add_argument("--output", default="central_records.jsonl")
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.port, args.output)
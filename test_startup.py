@@ -0,0 +1,15 @@
+import os
+import shutil
+import pytest
+import startup
+
+pytest.importorskip("flet")
+
+
+def test_first_frame_within_budget(tmp_path):
+    # A scratch directory, so the records and chart cache the app creates stay out of the real ones
+    shutil.copytree(os.path.join(os.path.dirname(os.path.abspath(startup.__file__)), "imagenes"), tmp_path / "imagenes")
+    seconds, heavy = startup.measure(cwd=tmp_path)
+    assert seconds is not None, "main_page never reached startup.first_frame()"
+    assert seconds <= startup.FIRST_FRAME_BUDGET, f"First frame took {seconds:.3f}s"
+    assert heavy == [], f"Imported before the first frame: {', '.join(heavy)}"
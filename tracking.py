@@ -0,0 +1,109 @@
+import math
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def box_centroid_distance(a, b):
+    return math.hypot((a[0] + a[2] - b[0] - b[2]) / 2, (a[1] + a[3] - b[1] - b[3]) / 2)
+
+
+class Track:
+    """One object followed across frames, with an exponentially smoothed confidence."""
+
+    def __init__(self, track_id, label, confidence, box):
+        self.track_id = track_id
+        self.label = label
+        self.box = box
+        self.score = confidence
+        self.confidence = confidence
+        self.hits = 1
+        self.misses = 0
+        self.confirmed = False
+
+
+class Tracker:
+    """Lightweight IoU/centroid tracker that confirms objects once evidence is sufficient.
+
+    Detections are matched to tracks of the same label by IoU, falling back
+    to centroid distance for fast-moving objects. Each hit blends the
+    detection confidence into the track score (EMA with weight `alpha`) and
+    each miss decays it. A track is confirmed once it has `min_hits` hits
+    and a score of at least `confirm_score`, so a confident object is
+    accepted after a few frames while a flickering one never is.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=40, alpha=0.5, confirm_score=0.6, min_hits=3, max_misses=5):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.alpha = alpha
+        self.confirm_score = confirm_score
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.tracks = []
+        self._next_id = 1
+
+    def reset(self):
+        self.tracks = []
+
+    def _match_score(self, track, label, box):
+        if track.label != label:
+            return None
+        iou = box_iou(track.box, box)
+        if iou >= self.iou_threshold:
+            return 1.0 + iou
+        distance = box_centroid_distance(track.box, box)
+        if distance <= self.max_distance:
+            return 1.0 - distance / (self.max_distance + 1)
+        return None
+
+    def update(self, detections):
+        """Feed one frame of (label, confidence, box) detections.
+
+        Returns the tracks confirmed by this frame, most confident first.
+        """
+        candidates = []
+        for track_index, track in enumerate(self.tracks):
+            for detection_index, (label, _, box) in enumerate(detections):
+                score = self._match_score(track, label, box)
+                if score is not None:
+                    candidates.append((score, track_index, detection_index))
+        candidates.sort(reverse=True)
+
+        matched_tracks, matched_detections = set(), set()
+        for _, track_index, detection_index in candidates:
+            if track_index in matched_tracks or detection_index in matched_detections:
+                continue
+            matched_tracks.add(track_index)
+            matched_detections.add(detection_index)
+            track = self.tracks[track_index]
+            _, confidence, box = detections[detection_index]
+            track.box = box
+            track.confidence = confidence
+            track.score += self.alpha * (confidence - track.score)
+            track.hits += 1
+            track.misses = 0
+
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                track.score *= 1 - self.alpha
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for detection_index, (label, confidence, box) in enumerate(detections):
+            if detection_index not in matched_detections:
+                self.tracks.append(Track(self._next_id, label, confidence, box))
+                self._next_id += 1
+
+        confirmed = []
+        for track in self.tracks:
+            if not track.confirmed and track.hits >= self.min_hits and track.score >= self.confirm_score:
+                track.confirmed = True
+                confirmed.append(track)
+        confirmed.sort(key=lambda track: track.score, reverse=True)
+        return confirmed
@@ -1,22 +1,23 @@
+import threading
 import flet as ft
 from flet import Page, Text, Container, Row, Column, DataTable, DataColumn, Image, ElevatedButton, Tabs, Tab, Divider, TextSpan
-from detection import detect_objects, camera
-from database import load_records_from_json
-from charts import generate_historical_data, create_chart,generate_total_co2_per_material,plot_co2_by_material
-from utils import update_record_list
-import cv2
-import base64
-import numpy as np
+from database import DEFAULT_USER, kiosk_settings, iter_records_from_json, load_record_aggregates, load_user_aggregates
+from charts import HISTORY_RANGES, co2_total, render_charts_async, render_history_async
+from history import RecordHistory
+from sync import get_sync_queue
+from assets import get_asset
+import metrics
+import startup
+
+# Only what the Home tab needs is imported above. NumPy/OpenCV (records, camera, detection)
+# and matplotlib (charts) are imported when their tab or feature is first used, and the
+# model loads in the background, so the first frame is not held up by them.
 
 def main_page(page: Page):
     page.window_width = 768
     page.window_height = 1024
     page.bgcolor = "#ffffff"
 
-    user_logo_path = "imagenes/user.png"
-    with open(user_logo_path, "rb") as image_file:
-        user_logo_str = base64.b64encode(image_file.read()).decode()
-
     header = Container(
         content=Row(
             controls=[
@@ -38,25 +39,67 @@ def main_page(page: Page):
         rows=[]
     )
 
-    object_records = load_records_from_json()
-    update_record_list(record_list, object_records, page)
+    records_view = Column([
+        Text("Registro de objetos detectados", size=30, weight="bold"),
+        ft.ProgressRing(),
+    ], scroll=ft.ScrollMode.ALWAYS)
+    record_pager = record_history = None
 
-    black_image = np.zeros((420, 420, 3), np.uint8)
-    _, buffer = cv2.imencode('.jpg', black_image)
-    black_image_str = base64.b64encode(buffer).decode()
-    image_control = Image(src_base64=black_image_str)
+    def get_records():
+        """Load the record history on first use: the Records tab, a chart range or the first detection."""
+        nonlocal record_pager, record_history
+        if record_pager is None:
+            from utils import RecordPager
+            from record_columns import RecordColumns
+            # Columnar in-memory copy of the history, filled straight from the record files; the pager
+            # appends new detections to it and the chart history is built from its arrays
+            object_records = RecordColumns.from_records(iter_records_from_json())
+            record_pager = RecordPager(record_list, object_records, page)
+            record_history = RecordHistory.from_columns(object_records)
+            records_view.controls[1:] = [record_pager.navigation, record_list]
+        return record_pager, record_history
+
+    image_control = Image(width=420, height=420)
     detection_text = Text("Detectado: None", size=25, weight="bold")
 
     instructions_label = Text("Instrucciónes: None", size=25, weight="bold")
+    model_status = Text("Modelo: pendiente", size=16, color="grey")
+
+    def on_model_state(state):
+        model_status.value = f"Modelo: {state}"
+        page.update()
+
+    home_image = Image(width=420, height=420)
+    user_logo = Image(width=100, height=100)
+
+    # Tab index -> (image control, asset name), resolved from the asset bundle when the tab is first shown
+    pending_assets = {
+        0: [(home_image, "home_image")],
+        1: [(image_control, "black_frame")],
+        4: [(user_logo, "user_logo")],
+    }
+
+    def load_tab_assets(index):
+        for control, name in pending_assets.pop(index, []):
+            control.src_base64 = get_asset(name)
 
-    home_image_path = "imagenes/contenedores.jpg"
-    with open(home_image_path, "rb") as image_file:
-        home_image_str = base64.b64encode(image_file.read()).decode()
+    def on_tab_change(e):
+        show_tab(tab_control.selected_index)
+        page.update()
 
     def switch_tab(index):
         tab_control.selected_index = index
+        show_tab(index)
         page.update()
 
+    def show_tab(index):
+        load_tab_assets(index)
+        if index == 2:
+            get_records()
+        elif index == 3:
+            start_charts()
+        refresh_profile(index)
+
     intro_text = Text(
         spans=[
             TextSpan("Esta aplicación utiliza la tecnología YOLO para reconocer diferentes tipos de residuos e indicarte como debes reciclarlos. Puedes empezar por, "),
@@ -75,37 +118,125 @@ def main_page(page: Page):
     home_content = Column([
         header,
         intro_text,
-        Image(src_base64=home_image_str, width=420, height=420)
+        home_image
     ])
 
-    chart_image_str_CO= plot_co2_by_material(object_records)
-    chart_image_2 = Image(src_base64=chart_image_str_CO)
+    # Charts are rendered off the UI thread and filled in when ready
+    chart_image = Image(visible=False)
+    chart_image_2 = Image(visible=False)
+    chart_progress = ft.ProgressRing()
+
+    def on_charts_rendered(chart_image_str, chart_image_str_CO):
+        chart_image.src_base64 = chart_image_str
+        chart_image_2.src_base64 = chart_image_str_CO
+        chart_image.visible = chart_image_2.visible = True
+        chart_progress.visible = False
+        page.update()
+
+    charts_started = False
+
+    def start_charts():
+        """Render the default charts the first time the Historical tab is shown; imports matplotlib."""
+        nonlocal charts_started
+        if not charts_started:
+            charts_started = True
+            render_charts_async(load_record_aggregates(), on_charts_rendered)
+
+    def on_history_range_change(e):
+        chart_progress.visible = True
+        page.update()
+        render_history_async(get_records()[1], history_range.value, on_charts_rendered)
 
-    months, points = generate_historical_data(object_records)
-    chart_image_str = create_chart(months, points)
-    chart_image = Image(src_base64=chart_image_str)
+    history_range = ft.Dropdown(
+        options=[ft.dropdown.Option(name) for name in HISTORY_RANGES],
+        value="Todo",
+        width=200,
+        on_change=on_history_range_change,
+    )
 
     historical_content = Column([
+        history_range,
         Text("Histórico de puntos", size=30, weight="bold"),
+        chart_progress,
         chart_image,
         Text("Histórico de CO₂ no emitido", size=30, weight="bold"),
         chart_image_2
     ],scroll=ft.ScrollMode.ALWAYS)
 
+    # Preview/detection run as tasks on the page loop; the handlers only request transitions
+    session = None
+
+    def get_session():
+        nonlocal session
+        if session is None:
+            from session import DetectionSession
+            pager, history = get_records()
+            session = DetectionSession(image_control, detection_text, instructions_label, pager, page,
+                                       record_history=history)
+        return session
+
     def on_camera_button_click(e):
-        camera(image_control, page)
+        get_session().start_preview()
 
     def on_detect_button_click(e):
-        detect_objects(instructions_label, detection_text, image_control, object_records, record_list, page)
+        get_session().start_detection()
+
+    # Profile of the signed-in user; totals come from the user's record shards, not the whole history
+    user_field = ft.TextField(label="Usuario", value=kiosk_settings["user"], width=250)
+    user_totals_text = Text(size=20)
+
+    def refresh_profile(index=4):
+        if index != 4:
+            return
+        aggregates = load_user_aggregates(kiosk_settings["user"])
+        points = sum(aggregates.material_points.values())
+        user_totals_text.value = (f"Objetos reciclados: {aggregates.record_count}\n"
+                                  f"Puntos: {points}\n"
+                                  f"CO₂ no emitido: {co2_total(aggregates.material_points):.1f} g")
+        refresh_diagnostics()
+
+    def on_user_change(e):
+        kiosk_settings["user"] = user_field.value.strip() or DEFAULT_USER
+        user_field.value = kiosk_settings["user"]
+        refresh_profile()
+        page.update()
+
+    user_field.on_submit = on_user_change
+
+    # Diagnostics panel in the profile tab; metrics are only collected with ECOALDASO_METRICS=1
+    diagnostics_text = Text(size=14, font_family="monospace", selectable=True)
+
+    def refresh_diagnostics():
+        lines = [f"{name}: {value}" for name, value in session.service.stats().items()] if session is not None else []
+        sync_queue = get_sync_queue()
+        if sync_queue is not None:
+            lines += [f"sync_{name}: {value}" for name, value in sync_queue.stats().items()]
+        if not metrics.enabled:
+            lines.append("Métricas desactivadas (ECOALDASO_METRICS=1 para activarlas)")
+        else:
+            lines.append(f"Prometheus: http://127.0.0.1:{metrics.METRICS_PORT}/metrics")
+            snapshot = metrics.snapshot()
+            lines += [f"{name}: {value}" for name, value in snapshot["counters"].items()]
+            lines += [
+                f"{name}: n={stage['count']} media={stage['mean_ms']:.1f}ms p50≤{stage['p50_ms']:.1f}ms p95≤{stage['p95_ms']:.1f}ms"
+                for name, stage in snapshot["stages"].items()
+            ]
+        diagnostics_text.value = "\n".join(lines)
+
+    def on_diagnostics_refresh(e):
+        refresh_diagnostics()
+        page.update()
 
     global tab_control
     tab_control = Tabs(
         selected_index=0,
         animation_duration=300,
+        on_change=on_tab_change,
         tabs=[
             Tab(text="Home", content=home_content),
             Tab(text="Detector", content=Column([
                 Text("Detector de residuos", size=30, weight="bold"),
+                model_status,
                 Divider(),
                 Row([
                     Column([
@@ -129,15 +260,18 @@ def main_page(page: Page):
                     ElevatedButton("Captura el residuo", bgcolor="#00c900", color="white", on_click=on_detect_button_click),
                 ])
             ])),
-            Tab(text="Registros", content=Column([
-                Text("Registro de objetos detectados", size=30, weight="bold"),
-                record_list
-            ], scroll=ft.ScrollMode.ALWAYS)),
+            Tab(text="Registros", content=records_view),
             Tab(text="Datos históricos", content=Column([historical_content],scroll=ft.ScrollMode.ALWAYS)),
             Tab(icon=ft.Icon(ft.icons.PERSON_2_ROUNDED), content=Column([
                 Text("Perfil del usuario", size=30, weight="bold"),
-                Image(src_base64=user_logo_str, width=100, height=100)
-            ]))
+                user_logo,
+                Row([user_field, ElevatedButton("Cambiar usuario", on_click=on_user_change)]),
+                user_totals_text,
+                Divider(),
+                Text("Diagnóstico", size=20, weight="bold"),
+                diagnostics_text,
+                ElevatedButton("Actualizar", on_click=on_diagnostics_refresh),
+            ], scroll=ft.ScrollMode.ALWAYS))
         ],
         expand=1
     )
@@ -147,4 +281,16 @@ def main_page(page: Page):
     tab_control.label_color = "#00c900"
     tab_control.overlay_color = "#00c900"
 
+    if metrics.enabled:
+        metrics.start_http_server()
+
+    load_tab_assets(tab_control.selected_index)
     page.add(tab_control)
+    startup.first_frame()
+
+    def start_model_loading():
+        from detection import load_model_async
+        load_model_async(on_model_state)
+
+    # Import the detection stack and load and warm up YOLO only once the window is on screen
+    threading.Thread(target=start_model_loading, daemon=True).start()
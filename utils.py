@@ -1,33 +1,103 @@
+import threading
 from flet import *
-import json
-
-def update_record_list(record_list, object_records, page):
-    # Sort object_records by 'timestamp' in descending order
-    sorted_records = sorted(object_records, key=lambda r: r['timestamp'], reverse=True)
-    
-    record_list.rows.clear()
-    for record in sorted_records:
-        label, confidence, points, timestamp = record['label'], record['confidence'], record['points'], record['timestamp']
-        record_list.rows.append(
+import numpy as np
+from record_columns import RecordColumns
+
+
+class RecordIndex:
+    """Records kept in timestamp order, newest last.
+
+    The records live in a RecordColumns; the index is an array of its row
+    numbers sorted by timestamp. New detections carry the latest timestamp,
+    so inserting them lands on the tail, and only the rows of the requested
+    page are turned back into dicts.
+    """
+
+    def __init__(self, records=()):
+        self.columns = records if isinstance(records, RecordColumns) else RecordColumns.from_records(records)
+        self._order = np.argsort(self.columns.column("timestamp"), kind="stable")
+        self._size = len(self._order)
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, record):
+        """Append a record to the columns and index it."""
+        row = len(self.columns)
+        self.columns.append(record)
+        timestamps = self.columns.column("timestamp")
+        if self._size == len(self._order):
+            self._order = np.concatenate([self._order, np.empty(max(1024, self._size), dtype=self._order.dtype)])
+        position = self._size
+        if self._size and timestamps[row] < timestamps[self._order[self._size - 1]]:
+            position = int(np.searchsorted(timestamps[self._order[:self._size]], timestamps[row], side="right"))
+            self._order[position + 1:self._size + 1] = self._order[position:self._size]
+        self._order[position] = row
+        self._size += 1
+
+    def newest(self, start, count):
+        """Return `count` records starting `start` records from the newest, newest first."""
+        end = self._size - start
+        return [self.columns.record(row) for row in self._order[max(0, end - count):max(0, end)][::-1]]
+
+
+class RecordPager:
+    """Paginated view of the records in a DataTable.
+
+    Only the rows of the visible page are materialized, so adding a record
+    rebuilds at most `page_size` rows instead of the whole history. New
+    records arrive on the page loop and page changes on Flet handler
+    threads, so both go through a lock.
+    """
+
+    def __init__(self, record_list, object_records, page, page_size=25):
+        self.record_list = record_list
+        self.page = page
+        self.page_size = page_size
+        self.index = RecordIndex(object_records)
+        self._lock = threading.Lock()
+        self.current_page = 0
+        self.page_label = Text()
+        self.previous_button = IconButton(icons.CHEVRON_LEFT, on_click=lambda e: self.show_page(self.current_page - 1))
+        self.next_button = IconButton(icons.CHEVRON_RIGHT, on_click=lambda e: self.show_page(self.current_page + 1))
+        self.navigation = Row([self.previous_button, self.page_label, self.next_button])
+        self.render()
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.index) // self.page_size))
+
+    def add(self, record):
+        """Add a new record to the shared columns; the table is only rebuilt if it is on the first page."""
+        with self._lock:
+            self.index.insert(record)
+            if self.current_page == 0:
+                self.render()
+            else:
+                self._update_navigation()
+        self.page.update()
+
+    def show_page(self, number):
+        with self._lock:
+            self.current_page = min(max(0, number), self.page_count - 1)
+            self.render()
+        self.page.update()
+
+    def render(self):
+        self.record_list.rows = [
             DataRow(
                 cells=[
-                    DataCell(Text(label)),
-                    DataCell(Text(f"{confidence:.2f}")),
-                    DataCell(Text(f"{points}")),
-                    DataCell(Text(timestamp)),
+                    DataCell(Text(record['label'])),
+                    DataCell(Text(f"{record['confidence']:.2f}")),
+                    DataCell(Text(f"{record['points']}")),
+                    DataCell(Text(record['timestamp'])),
                 ]
             )
-        )
-    page.update()
-
-
-def load_records_from_json():
-    with open('records.json', 'r') as file:
-        return json.load(file)
+            for record in self.index.newest(self.current_page * self.page_size, self.page_size)
+        ]
+        self._update_navigation()
 
-def insert_record_into_json(record):
-    with open('records.json', 'r+') as file:
-        data = json.load(file)
-        data.append(record)
-        file.seek(0)
-        json.dump(data, file, indent=4)
+    def _update_navigation(self):
+        self.page_label.value = f"Página {self.current_page + 1} de {self.page_count}"
+        self.previous_button.disabled = self.current_page == 0
+        self.next_button.disabled = self.current_page >= self.page_count - 1